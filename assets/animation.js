@@ -0,0 +1,102 @@
+// Client-side playback for the dashboard's Animation tab.
+// animation-data holds a whole run, encoded once by encode_animation() in dashapp.py:
+// base64 float32 positions (frames, N, 2) and uint8 state codes (frames, N).
+
+var STATE_INFECTED = 1;
+var STATE_IMMUNE = 2;
+
+var decoded = {runId: null, positions: null, states: null};
+
+function decodeBase64(text) {
+    var binary = atob(text);
+    var bytes = new Uint8Array(binary.length);
+    for (var i = 0; i < binary.length; i++) {
+        bytes[i] = binary.charCodeAt(i);
+    }
+    return bytes;
+}
+
+function decodeRun(data) {
+    if (decoded.runId !== data.run_id) {
+        decoded.positions = new Float32Array(decodeBase64(data.positions).buffer);
+        decoded.states = decodeBase64(data.states);
+        decoded.runId = data.run_id;
+    }
+    return decoded;
+}
+
+function frameFigure(data, frame) {
+    var run = decodeRun(data);
+    var n = data.num_agents;
+    var groups = {
+        infected: {name: 'Infected', color: 'red', x: [], y: []},
+        immune: {name: 'Immune', color: 'blue', x: [], y: []},
+        healthy: {name: 'Healthy', color: 'green', x: [], y: []}
+    };
+    var offset = frame * n;
+    for (var i = 0; i < n; i++) {
+        var state = run.states[offset + i];
+        var group = (state & STATE_INFECTED) ? groups.infected
+            : (state & STATE_IMMUNE) ? groups.immune : groups.healthy;
+        group.x.push(run.positions[2 * (offset + i)]);
+        group.y.push(run.positions[2 * (offset + i) + 1]);
+    }
+    // Same switch to WebGL markers as create_state_figure in dashapp.py.
+    var webgl = n > data.svg_max_points;
+    var traces = [];
+    ['infected', 'immune', 'healthy'].forEach(function (key) {
+        var group = groups[key];
+        if (group.x.length > 0) {
+            traces.push({
+                type: webgl ? 'scattergl' : 'scatter', mode: 'markers', name: group.name,
+                x: group.x, y: group.y, marker: {color: group.color, size: webgl ? 3 : 8}
+            });
+        }
+    });
+    return {
+        data: traces,
+        layout: {
+            title: {text: 'Timestep: ' + (data.steps[frame] + 1)},
+            xaxis: {range: data.bounds, showticklabels: false},
+            yaxis: {range: data.bounds, showticklabels: false},
+            height: 500
+        }
+    };
+}
+
+window.dash_clientside = Object.assign({}, window.dash_clientside, {
+    animation: {
+        update: function (data, prevClicks, nextClicks, playClicks, nIntervals, state) {
+            var noUpdate = window.dash_clientside.no_update;
+            if (!data) {
+                return [noUpdate, 'No simulation data', true, noUpdate];
+            }
+            var triggered = window.dash_clientside.callback_context.triggered;
+            var trigger = triggered.length ? triggered[0].prop_id.split('.')[0] : '';
+            var frame = state.frame;
+            var playing = state.playing;
+            var last = data.num_frames - 1;
+
+            if (trigger === 'animation-data') {
+                frame = 0;
+                playing = false;
+            } else if (trigger === 'play-button') {
+                playing = !playing;
+            } else if (trigger === 'next-button') {
+                frame = Math.min(frame + 1, last);
+            } else if (trigger === 'prev-button') {
+                frame = Math.max(frame - 1, 0);
+            } else if (trigger === 'animation-interval' && playing) {
+                frame = frame >= last ? 0 : frame + 1;
+            }
+            frame = Math.min(frame, last);
+
+            return [
+                frameFigure(data, frame),
+                'Frame ' + (frame + 1) + ' of ' + data.num_frames,
+                !playing,
+                {frame: frame, playing: playing}
+            ];
+        }
+    }
+});
@@ -0,0 +1,213 @@
+import argparse
+import json
+import multiprocessing
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+import time
+
+import numpy as np
+
+from export import RunExporter
+from profiling import StepProfiler
+from recorder import FrameRecorder
+from simulation import simulateRun
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+DEFAULT_SIZES = (500, 5000, 50000, 500000)
+
+# Engine/backend combinations with the largest population each can handle in reasonable time and memory.
+CONFIGS = {
+    "agents-dense-sequential": dict(engine="agents", backend="dense", mode="sequential", max_agents=5000),
+    "population-kdtree-sequential": dict(engine="population", backend="kdtree", mode="sequential", max_agents=50000),
+    "population-kdtree-contact": dict(engine="population", backend="kdtree", mode="contact", max_agents=None),
+    "population-kdtree-agent": dict(engine="population", backend="kdtree", mode="agent", max_agents=None),
+    "population-active-contact": dict(engine="population", backend="active", mode="contact", max_agents=None),
+}
+
+
+def scaledBounds(num_agents, reference_agents=500, reference_side=500):
+    """Grows the plane with the population so density, and contacts per agent, match the default 500-agent run."""
+    return (0, reference_side * np.sqrt(num_agents / reference_agents))
+
+
+def benchmarkCase(config, num_agents, steps=20, warmup=3, seed=0, step_size=5, proximity=10,
+                  resistance=0.3, infected_fraction=0.01, record=False, export=False):
+    """
+    Times whole steps of simulateRun end to end for one configuration and population
+    size: everything in the step loop counts, statistics and transition bookkeeping
+    included, plus frame recording with record and exporting with export.
+
+    The per-phase breakdown comes from a StepProfiler in the same run; "other" is
+    the part of the step outside every phase. At least one warm-up step is run,
+    since the end of the last one starts the clock.
+
+    Returns:
+    dict: Seconds per whole step, steps/sec, agent-steps/sec, the process's peak
+        RSS in MB and the mean seconds per step of every phase.
+    """
+    options = CONFIGS[config]
+    warmup = max(warmup, 1)
+    timesteps = warmup + steps
+    finished = []
+    profiler = StepProfiler()
+    with tempfile.TemporaryDirectory(prefix="benchmark_") as directory:
+        recorder = FrameRecorder(os.path.join(directory, "frames"), num_agents, timesteps) if record else None
+        exporter = None
+        if export:
+            exporter = RunExporter(os.path.join(directory, "export"), events=options["engine"] == "population")
+        try:
+            simulateRun(num_agents, max(1, int(num_agents * infected_fraction)), resistance, step_size,
+                        scaledBounds(num_agents), timesteps, proximity, vaccination_rate=0.0, vaccination_step=-1,
+                        contact_backend=options["backend"], infection_mode=options["mode"],
+                        rng=np.random.default_rng(seed), recorder=recorder, profiler=profiler,
+                        onStep=lambda step, statistics: finished.append(time.perf_counter()),
+                        exporter=exporter, engine=options["engine"])
+        finally:
+            if recorder is not None:
+                recorder.close()
+            if exporter is not None:
+                exporter.close()
+
+    step_total = finished[-1] - finished[warmup - 1]
+    seconds_per_step = step_total / steps
+    measured = profiler.steps[warmup:]
+    phases = {}
+    for step in measured:
+        for phase, seconds in step["seconds"].items():
+            phases[phase] = phases.get(phase, 0.0) + seconds / steps
+    phases["other"] = max(seconds_per_step - sum(phases.values()), 0.0)
+
+    return {
+        "config": config,
+        "num_agents": num_agents,
+        "steps": steps,
+        "seconds_per_step": seconds_per_step,
+        "steps_per_sec": steps / step_total,
+        "agent_steps_per_sec": num_agents * steps / step_total,
+        "peak_rss_mb": peakRssMb(),
+        "phase_seconds_per_step": phases,
+    }
+
+
+def peakRssMb():
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # ru_maxrss is in kilobytes on Linux and bytes on macOS.
+    return peak / (1024 ** 2 if sys.platform == "darwin" else 1024)
+
+
+def _runCase(arguments):
+    return benchmarkCase(*arguments[:2], **arguments[2])
+
+
+def runBenchmarks(configs=tuple(CONFIGS), sizes=DEFAULT_SIZES, isolate=True, **options):
+    """
+    Runs every configuration at every size it supports.
+
+    With isolate, each case runs in a freshly spawned process so its peak RSS is its own.
+    """
+    cases = [
+        (config, num_agents, options)
+        for config in configs
+        for num_agents in sizes
+        if CONFIGS[config]["max_agents"] is None or num_agents <= CONFIGS[config]["max_agents"]
+    ]
+    results = []
+    for case in cases:
+        if isolate:
+            with multiprocessing.get_context("spawn").Pool(1) as pool:
+                result = pool.apply(_runCase, (case,))
+        else:
+            result = _runCase(case)
+        printResult(result)
+        results.append(result)
+    return {"meta": environment(), "results": results}
+
+
+def environment():
+    try:
+        commit = subprocess.run(["git", "rev-parse", "HEAD"], capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        commit = None
+    return {
+        "commit": commit,
+        "python": platform.python_version(),
+        "numpy": np.__version__,
+        "platform": platform.platform(),
+        "processor": platform.processor(),
+        "time": time.strftime("%Y-%m-%dT%H:%M:%S"),
+    }
+
+
+def printResult(result):
+    phases = ", ".join(f"{phase} {seconds * 1000:.2f} ms" for phase, seconds in result["phase_seconds_per_step"].items())
+    rss = "n/a" if result["peak_rss_mb"] is None else f"{result['peak_rss_mb']:.0f} MB"
+    print(
+        f"{result['config']:<30} N={result['num_agents']:<8} {result['seconds_per_step'] * 1000:10.2f} ms/step "
+        f"{result['steps_per_sec']:9.2f} steps/s {result['agent_steps_per_sec']:12.0f} agent-steps/s  "
+        f"peak RSS {rss}\n{'':<41}phases: {phases}"
+    )
+
+
+def findRegressions(current, baseline, threshold=0.1):
+    """
+    Compares steps/sec against a baseline report.
+
+    Returns:
+    list: (config, num_agents, baseline steps/sec, current steps/sec) for every case slower
+        than the baseline by more than threshold (a fraction).
+    """
+    previous = {(result["config"], result["num_agents"]): result for result in baseline["results"]}
+    regressions = []
+    for result in current["results"]:
+        old = previous.get((result["config"], result["num_agents"]))
+        if old is None:
+            continue
+        if result["steps_per_sec"] < old["steps_per_sec"] * (1 - threshold):
+            regressions.append((result["config"], result["num_agents"], old["steps_per_sec"], result["steps_per_sec"]))
+    return regressions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark step throughput across population sizes and backends.")
+    parser.add_argument("--sizes", type=int, nargs="+", default=list(DEFAULT_SIZES))
+    parser.add_argument("--configs", nargs="+", choices=list(CONFIGS), default=list(CONFIGS))
+    parser.add_argument("--steps", type=int, default=20)
+    parser.add_argument("--warmup", type=int, default=3)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--record", action="store_true", help="Record frames every step, as a rendered run does")
+    parser.add_argument("--export", action="store_true", help="Export counts (and events) every step")
+    parser.add_argument("--no-isolate", action="store_true", help="Run every case in this process")
+    parser.add_argument("--output", default="benchmark.json")
+    parser.add_argument("--baseline", help="Earlier benchmark JSON to compare against")
+    parser.add_argument("--threshold", type=float, default=0.1,
+                        help="Allowed steps/sec drop against the baseline, as a fraction")
+    args = parser.parse_args(argv)
+
+    report = runBenchmarks(args.configs, args.sizes, not args.no_isolate,
+                           steps=args.steps, warmup=args.warmup, seed=args.seed, record=args.record,
+                           export=args.export)
+    with open(args.output, "w") as output_file:
+        json.dump(report, output_file, indent=2)
+    print(f"Results saved as {args.output}")
+
+    if args.baseline:
+        with open(args.baseline) as baseline_file:
+            regressions = findRegressions(report, json.load(baseline_file), args.threshold)
+        for config, num_agents, old, new in regressions:
+            print(f"REGRESSION {config} N={num_agents}: {old:.2f} -> {new:.2f} steps/s")
+        if regressions:
+            return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,409 @@
+import argparse
+import hashlib
+import itertools
+import json
+import os
+import shutil
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import contextmanager
+
+import numpy as np
+from scipy.stats import qmc
+
+import kernels
+from recorder import FrameReader, FrameRecorder
+from simulation import simulateRun
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+
+CACHE_VERSION = 1
+DEFAULT_CACHE_DIR = os.path.join(os.path.expanduser("~"), ".cache", "disease_simulation")
+DEFAULT_MAX_BYTES = 2 * 1024 ** 3
+
+def _integer(value):
+    # Also accepts "10.0": --grid and --lhs values come in as text.
+    return int(float(value))
+
+
+# Every simulateRun argument that changes the result, with its default and type.
+# contact_backend only changes how contacts are found, not which, so it is not part of the key.
+PARAMETERS = {
+    "num_agents": (500, _integer),
+    "num_initial_infected": (10, _integer),
+    "resistance": (0.3, float),
+    "proximity": (10, float),
+    "step_size": (5, float),
+    "timesteps": (500, _integer),
+    "vaccination_rate": (0.2, float),
+    "vaccination_step": (100, _integer),
+    "bounds": ((0, 500), lambda bounds: [float(bounds[0]), float(bounds[1])]),
+    "infection_mode": ("sequential", str),
+}
+FRAMES_SUFFIX = ".frames"
+TEMP_SUFFIX = ".tmp"
+LOCK_SUFFIX = ".lock"
+# Temporary files and directories older than this are left over from interrupted writes.
+STALE_TEMP_SECONDS = 24 * 60 * 60
+
+
+def normalizeParams(params):
+    """Fills in defaults and casts values so equal parameter sets always hash the same."""
+    unknown = set(params) - set(PARAMETERS)
+    if unknown:
+        raise ValueError(f"Unknown simulation parameters: {sorted(unknown)}")
+    return {name: cast(params.get(name, default)) for name, (default, cast) in PARAMETERS.items()}
+
+
+def cacheKey(params, seed):
+    payload = {"version": CACHE_VERSION, "seed": int(seed), "params": normalizeParams(params)}
+    encoded = json.dumps(payload, sort_keys=True, separators=(",", ":")).encode()
+    return hashlib.sha256(encoded).hexdigest()
+
+
+class ResultCache:
+    """
+    Content-addressed on-disk cache of simulation results.
+
+    Each (parameters, seed) result is a compressed .npz file of statistics named
+    by its hash, plus a FrameRecorder directory next to it when frames were
+    requested. Reads bump the entry's modification time, and writes evict the
+    least recently used entries until the directory fits in max_bytes.
+
+    Results are written under unique temporary names and moved into place, and
+    a miss holds a lock file per key while it runs, so concurrent fetches of
+    the same result run it once.
+    """
+
+    def __init__(self, directory=DEFAULT_CACHE_DIR, max_bytes=DEFAULT_MAX_BYTES):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        os.makedirs(directory, exist_ok=True)
+
+    def path(self, key):
+        return os.path.join(self.directory, f"{key}.npz")
+
+    def framesPath(self, key):
+        return os.path.join(self.directory, f"{key}{FRAMES_SUFFIX}")
+
+    def get(self, params, seed, frames=False):
+        key = cacheKey(params, seed)
+        path = self.path(key)
+        if frames and not FrameReader.exists(self.framesPath(key)):
+            return None
+        try:
+            with np.load(path) as stored:
+                result = {"statistics": stored["statistics"]}
+            if frames:
+                result["frames"] = FrameReader(self.framesPath(key))
+        except (FileNotFoundError, OSError, ValueError, KeyError):
+            return None
+        for touched in (path, self.framesPath(key)):
+            try:
+                os.utime(touched)
+            except FileNotFoundError:
+                pass
+        return result
+
+    def contains(self, params, seed, frames=False):
+        key = cacheKey(params, seed)
+        if not os.path.exists(self.path(key)):
+            return False
+        return not frames or FrameReader.exists(self.framesPath(key))
+
+    def put(self, params, seed, result):
+        path = self.path(cacheKey(params, seed))
+        handle, temp_path = tempfile.mkstemp(dir=self.directory, suffix=TEMP_SUFFIX)
+        try:
+            with os.fdopen(handle, "wb") as temp_file:
+                np.savez_compressed(temp_file, statistics=result["statistics"])
+            os.replace(temp_path, path)
+        except BaseException:
+            if os.path.exists(temp_path):
+                os.remove(temp_path)
+            raise
+        self.evict()
+
+    def fetch(self, params, seed, frames=False, frame_stride=1, profiler=None, onStart=None, onStep=None):
+        """
+        Returns the cached result, running and storing the simulation on a miss.
+
+        On a miss, onStart(recorder) receives the FrameRecorder (None without frames) before the
+        first step, and profiler and onStep are passed on to simulateRun.
+        """
+        result = self.get(params, seed, frames)
+        if result is not None:
+            return result
+        key = cacheKey(params, seed)
+        with self._lock(key):
+            # Another fetch may have stored it while this one waited for the lock.
+            result = self.get(params, seed, frames)
+            if result is not None:
+                return result
+            if not frames:
+                if onStart is not None:
+                    onStart(None)
+                result = runCell(params, seed, profiler=profiler, onStep=onStep)
+                self.put(params, seed, result)
+                return result
+
+            frames_path = self.framesPath(key)
+            temp_dir = tempfile.mkdtemp(dir=self.directory, suffix=TEMP_SUFFIX)
+            try:
+                result = runCell(params, seed, temp_dir, frame_stride, profiler, onStart, onStep)
+                self._replaceFrames(temp_dir, frames_path)
+            finally:
+                shutil.rmtree(temp_dir, ignore_errors=True)
+            # Open the frames before put() can evict them, the memory maps outlive the files.
+            result["frames"] = FrameReader(frames_path)
+            self.put(params, seed, result)
+            return result
+
+    @contextmanager
+    def _lock(self, key):
+        if fcntl is None:
+            yield
+            return
+        # Lock files are never removed: another process may be waiting on the one it opened.
+        with open(os.path.join(self.directory, f"{key}{LOCK_SUFFIX}"), "a") as lock_file:
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+    @staticmethod
+    def _replaceFrames(temp_dir, frames_path):
+        if FrameReader.exists(frames_path):
+            return
+        # Whatever is there is an incomplete write.
+        shutil.rmtree(frames_path, ignore_errors=True)
+        try:
+            os.replace(temp_dir, frames_path)
+        except OSError:
+            # Without locks another fetch may have moved its copy in first; the two are identical.
+            if not FrameReader.exists(frames_path):
+                raise
+
+    def entries(self):
+        """Returns {key: (last_used, size_in_bytes)} for every cached result."""
+        entries = {}
+        for name in os.listdir(self.directory):
+            full_path = os.path.join(self.directory, name)
+            if name.endswith(".npz"):
+                key = name[:-len(".npz")]
+            elif name.endswith(FRAMES_SUFFIX):
+                key = name[:-len(FRAMES_SUFFIX)]
+            else:
+                continue
+            try:
+                last_used = os.stat(full_path).st_mtime
+                size = _diskUsage(full_path)
+            except FileNotFoundError:
+                continue
+            previous_used, previous_size = entries.get(key, (last_used, 0))
+            entries[key] = (max(last_used, previous_used), previous_size + size)
+        return entries
+
+    def remove(self, key):
+        try:
+            os.remove(self.path(key))
+        except FileNotFoundError:
+            pass
+        shutil.rmtree(self.framesPath(key), ignore_errors=True)
+
+    def sweepTemp(self, max_age=STALE_TEMP_SECONDS):
+        """
+        Removes temporary files and directories older than max_age seconds, left
+        behind by interrupted writes.
+
+        Returns:
+        int: Bytes still held by the younger ones, which may belong to writes in progress.
+        """
+        in_progress = 0
+        now = time.time()
+        for name in os.listdir(self.directory):
+            if not name.endswith(TEMP_SUFFIX):
+                continue
+            full_path = os.path.join(self.directory, name)
+            try:
+                stale = now - os.stat(full_path).st_mtime > max_age
+                size = 0 if stale else _diskUsage(full_path)
+            except FileNotFoundError:
+                continue
+            if not stale:
+                in_progress += size
+            elif os.path.isdir(full_path):
+                shutil.rmtree(full_path, ignore_errors=True)
+            else:
+                try:
+                    os.remove(full_path)
+                except FileNotFoundError:
+                    pass
+        return in_progress
+
+    def evict(self):
+        entries = self.entries()
+        total = self.sweepTemp() + sum(size for _, size in entries.values())
+        for key, (_, size) in sorted(entries.items(), key=lambda item: item[1][0]):
+            if total <= self.max_bytes:
+                break
+            self.remove(key)
+            total -= size
+
+    def clear(self):
+        for key in self.entries():
+            self.remove(key)
+        self.sweepTemp()
+
+
+def _diskUsage(path):
+    if not os.path.isdir(path):
+        return os.path.getsize(path)
+    return sum(entry.stat().st_size for entry in os.scandir(path) if entry.is_file())
+
+
+def runCell(params, seed, frames_dir=None, frame_stride=1, profiler=None, onStart=None, onStep=None):
+    params = normalizeParams(params)
+    params["bounds"] = tuple(params["bounds"])
+    rng = np.random.default_rng(seed)
+    if frames_dir is None:
+        result = simulateRun(rng=rng, profiler=profiler, onStep=onStep, **params)
+    else:
+        with FrameRecorder(frames_dir, params["num_agents"], params["timesteps"], frame_stride) as recorder:
+            if onStart is not None:
+                onStart(recorder)
+            result = simulateRun(rng=rng, recorder=recorder, profiler=profiler, onStep=onStep, **params)
+    # Only the statistics, as a cache hit returns; the final agents are not kept.
+    return {"statistics": result["statistics"]}
+
+
+def _runJob(job):
+    params, seed = job
+    return runCell(params, seed)["statistics"]
+
+
+def gridCells(**axes):
+    """Every combination of the given parameter values, e.g. gridCells(resistance=[0.1, 0.3], proximity=[5, 10])."""
+    names = list(axes)
+    return [dict(zip(names, values)) for values in itertools.product(*(axes[name] for name in names))]
+
+
+def latinHypercubeCells(ranges, samples, seed=None):
+    """
+    Latin-hypercube samples over parameter ranges, e.g. {"resistance": (0.1, 0.9)}.
+    Integer parameters are rounded to the nearest whole value.
+    """
+    names = list(ranges)
+    sampler = qmc.LatinHypercube(d=len(names), seed=seed)
+    lower = [ranges[name][0] for name in names]
+    upper = [ranges[name][1] for name in names]
+    points = qmc.scale(sampler.random(samples), lower, upper)
+    cells = []
+    for point in points:
+        cell = {}
+        for name, value in zip(names, point):
+            cast = PARAMETERS[name][1]
+            cell[name] = int(round(value)) if cast is _integer else cast(value)
+        cells.append(cell)
+    return cells
+
+
+def runSweep(cells, cache=None, seeds=(0,), workers=None, base=None):
+    """
+    Runs every (cell, seed) combination that is not cached yet and returns all their statistics.
+
+    Parameters:
+    cells (list): Parameter dicts from gridCells or latinHypercubeCells.
+    cache (ResultCache): Where results are read from and stored, a default cache when None.
+    seeds (iterable): Seeds run for every cell.
+    workers (int): Worker processes for the missing runs (default: all cores).
+    base (dict): Parameters shared by every cell, overridden by the cell's own values.
+
+    Returns:
+    list: (params, seed, statistics) tuples in cells x seeds order.
+    """
+    cache = ResultCache() if cache is None else cache
+    jobs = [(normalizeParams({**(base or {}), **cell}), seed) for cell in cells for seed in seeds]
+    results = {}
+    missing = []
+    for index, (params, seed) in enumerate(jobs):
+        cached = cache.get(params, seed)
+        if cached is None:
+            missing.append(index)
+        else:
+            results[index] = cached["statistics"]
+
+    if missing:
+        if workers is None:
+            workers = os.cpu_count() or 1
+        workers = max(1, min(workers, len(missing)))
+        pending = [jobs[index] for index in missing]
+        if workers == 1:
+            computed = map(_runJob, pending)
+        else:
+            pool = ProcessPoolExecutor(max_workers=workers, mp_context=kernels.poolContext())
+            computed = pool.map(_runJob, pending)
+        try:
+            for index, statistics in zip(missing, computed):
+                params, seed = jobs[index]
+                # Stored as each run finishes, so an interrupted sweep restarts where it stopped.
+                cache.put(params, seed, {"statistics": statistics})
+                results[index] = statistics
+        finally:
+            if workers > 1:
+                pool.shutdown()
+
+    return [(params, seed, results[index]) for index, (params, seed) in enumerate(jobs)]
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Run a cached parameter sweep of the disease simulation.")
+    parser.add_argument("--grid", nargs="+", default=[], metavar="NAME=V1,V2,...",
+                        help="Grid axis, e.g. resistance=0.1,0.3,0.5")
+    parser.add_argument("--lhs", nargs="+", default=[], metavar="NAME=LOW,HIGH",
+                        help="Latin-hypercube range, e.g. proximity=5,20")
+    parser.add_argument("--samples", type=int, default=20, help="Latin-hypercube sample count")
+    parser.add_argument("--seeds", type=int, nargs="+", default=[0])
+    parser.add_argument("--workers", type=int, default=None)
+    parser.add_argument("--cache-dir", default=DEFAULT_CACHE_DIR)
+    parser.add_argument("--max-bytes", type=int, default=DEFAULT_MAX_BYTES)
+    parser.add_argument("--output", default="sweep_stats.npz")
+    args = parser.parse_args(argv)
+
+    def parseAxes(specs):
+        axes = {}
+        for spec in specs:
+            name, values = spec.split("=", 1)
+            axes[name] = [PARAMETERS[name][1](value) for value in values.split(",")]
+        return axes
+
+    if args.lhs:
+        ranges = {name: tuple(values) for name, values in parseAxes(args.lhs).items()}
+        cells = latinHypercubeCells(ranges, args.samples, seed=args.seeds[0])
+    else:
+        cells = gridCells(**parseAxes(args.grid))
+
+    cache = ResultCache(args.cache_dir, args.max_bytes)
+    cached = sum(cache.contains(normalizeParams(cell), seed) for cell in cells for seed in args.seeds)
+    results = runSweep(cells, cache, args.seeds, args.workers)
+    arrays = {
+        "params": np.array([json.dumps(params, sort_keys=True) for params, _, _ in results]),
+        "seeds": np.array([seed for _, seed, _ in results]),
+    }
+    if len({statistics.shape for _, _, statistics in results}) == 1:
+        arrays["statistics"] = np.stack([statistics for _, _, statistics in results])
+    else:
+        # Sweeping timesteps gives runs of different lengths, keep one array per run.
+        arrays.update({f"statistics_{i}": statistics for i, (_, _, statistics) in enumerate(results)})
+    np.savez_compressed(args.output, **arrays)
+    print(f"{len(results)} runs, {cached} served from cache")
+    print(f"Statistics saved as {args.output}")
+
+
+if __name__ == "__main__":
+    main()
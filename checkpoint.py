@@ -0,0 +1,151 @@
+import json
+import os
+import struct
+import tempfile
+
+import numpy as np
+
+from population import Population
+
+# File layout: MAGIC, the header length as a little-endian uint64, the JSON header,
+# then every array as raw bytes. Array offsets in the header count from the first
+# ALIGNMENT boundary after the header, and every array starts on a boundary.
+MAGIC = b"SIMCKPT1"
+ALIGNMENT = 64
+POPULATION_ARRAYS = ("x", "y", "infected", "resistance", "immunity",
+                     "immunityCounter", "infectedCounter", "vaccinated")
+
+
+def saveCheckpoint(path, population, step, statistics, rng=None, params=None):
+    """
+    Atomically writes a checkpoint of a run after `step` completed steps.
+
+    The file holds the agent arrays, the random state (the global np.random state
+    when rng is None), the statistics recorded so far and the run's parameters.
+    It is written to a temporary file next to path and renamed over it, so a
+    crash leaves the previous checkpoint intact.
+
+    Parameters:
+    path (str): Checkpoint file.
+    population (Population): Agents after the step.
+    step (int): Number of completed steps; a resumed run continues with this step index.
+    statistics (array-like): (step, 3) trackCounts rows recorded so far.
+    rng (np.random.Generator): The run's generator, or None for the global state.
+    params (dict): JSON-able run parameters, used as the defaults when resuming.
+    """
+    # A scheduled Population only stores due steps; the counters are what gets saved.
+    population.sync_counters()
+    arrays = {name: np.ascontiguousarray(getattr(population, name)) for name in POPULATION_ARRAYS}
+    arrays["statistics"] = np.ascontiguousarray(np.asarray(statistics, dtype=np.int64).reshape(-1, 3))
+    random_state = rng.bit_generator.state if isinstance(rng, np.random.Generator) else np.random.get_state(legacy=False)
+    header = {
+        "step": int(step),
+        "params": params or {},
+        "random": {"generator": isinstance(rng, np.random.Generator), "state": _encodeState(random_state)},
+        "arrays": {},
+    }
+    offset = 0
+    for name, array in arrays.items():
+        header["arrays"][name] = {"dtype": array.dtype.str, "shape": list(array.shape), "offset": offset}
+        offset = _aligned(offset + array.nbytes)
+    encoded = json.dumps(header).encode()
+    data_start = _dataStart(len(encoded))
+
+    directory = os.path.dirname(os.path.abspath(path))
+    handle, temp_path = tempfile.mkstemp(dir=directory, suffix=".tmp")
+    try:
+        with os.fdopen(handle, "wb") as temp_file:
+            temp_file.write(MAGIC + struct.pack("<Q", len(encoded)) + encoded)
+            for name, array in arrays.items():
+                temp_file.seek(data_start + header["arrays"][name]["offset"])
+                temp_file.write(array.tobytes())
+            temp_file.flush()
+            os.fsync(temp_file.fileno())
+        os.replace(temp_path, path)
+    except BaseException:
+        if os.path.exists(temp_path):
+            os.remove(temp_path)
+        raise
+
+
+class Checkpoint:
+    """
+    A checkpoint file opened with its arrays memory-mapped read-only, so opening
+    one costs a header read however large the population is.
+
+    checkpoint.step is the number of completed steps, checkpoint.params the saved
+    run parameters and checkpoint.statistics the (step, 3) statistics so far.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        with open(path, "rb") as checkpoint_file:
+            magic = checkpoint_file.read(len(MAGIC))
+            if magic != MAGIC:
+                raise ValueError(f"{path} is not a simulation checkpoint")
+            (length,) = struct.unpack("<Q", checkpoint_file.read(8))
+            header = json.loads(checkpoint_file.read(length))
+        self.step = header["step"]
+        self.params = header["params"]
+        self._random = header["random"]
+        data_start = _dataStart(length)
+        self.arrays = {
+            name: _mapArray(path, entry, data_start) for name, entry in header["arrays"].items()
+        }
+        self.statistics = self.arrays["statistics"]
+
+    def population(self, scheduled=True):
+        """A new Population with the saved state; Population copies the mapped arrays."""
+        return Population(*(self.arrays[name] for name in POPULATION_ARRAYS), scheduled=scheduled)
+
+    def random(self):
+        """
+        Restores the saved random state. Returns a new Generator when the run used one,
+        otherwise sets the global np.random state and returns None.
+        """
+        state = _decodeState(self._random["state"])
+        if not self._random["generator"]:
+            np.random.set_state(state)
+            return None
+        bit_generator = getattr(np.random, state["bit_generator"])()
+        bit_generator.state = state
+        return np.random.Generator(bit_generator)
+
+
+def loadCheckpoint(path):
+    return Checkpoint(path)
+
+
+def _mapArray(path, entry, data_start):
+    shape = tuple(entry["shape"])
+    if int(np.prod(shape)) == 0:
+        # np.memmap cannot map zero bytes.
+        return np.empty(shape, dtype=entry["dtype"])
+    return np.memmap(path, dtype=entry["dtype"], mode="r", offset=data_start + entry["offset"], shape=shape)
+
+
+def _aligned(offset):
+    return -(-offset // ALIGNMENT) * ALIGNMENT
+
+
+def _dataStart(header_length):
+    return _aligned(len(MAGIC) + 8 + header_length)
+
+
+def _encodeState(state):
+    # Bit generator states are nested dicts of ints, some with uint32 key arrays (MT19937).
+    if isinstance(state, dict):
+        return {key: _encodeState(value) for key, value in state.items()}
+    if isinstance(state, np.ndarray):
+        return {"__array__": state.tolist(), "dtype": state.dtype.str}
+    if isinstance(state, np.generic):
+        return state.item()
+    return state
+
+
+def _decodeState(state):
+    if isinstance(state, dict):
+        if "__array__" in state:
+            return np.array(state["__array__"], dtype=state["dtype"])
+        return {key: _decodeState(value) for key, value in state.items()}
+    return state
@@ -0,0 +1,164 @@
+import itertools
+
+import numpy as np
+from scipy.spatial import cKDTree, distance_matrix, minkowski_distance
+
+import kernels
+
+CONTACT_BACKENDS = ("dense", "kdtree")
+
+
+def densePairs(positions, proximity_threshold=10):
+    """Reference contact search: every pair closer than the threshold, from a full distance matrix."""
+    distanceMatrix = distance_matrix(positions, positions)
+    close = np.triu(distanceMatrix < proximity_threshold, k=1)
+    return np.argwhere(close)
+
+
+def kdtreePairs(positions, proximity_threshold=10):
+    """Contact search with a KD-tree; O(N log N) time and memory proportional to the number of contacts."""
+    if len(positions) == 0:
+        return np.empty((0, 2), dtype=np.intp)
+    pairs = cKDTree(positions).query_pairs(proximity_threshold, output_type="ndarray")
+    # query_pairs is inclusive of the radius, the simulation has always used a strict "<".
+    distances = minkowski_distance(positions[pairs[:, 0]], positions[pairs[:, 1]])
+    pairs = pairs[distances < proximity_threshold]
+    return pairs.astype(np.intp, copy=False)
+
+
+def contactPairs(positions, proximity_threshold=10, backend="kdtree"):
+    """
+    Returns an (M, 2) array of index pairs (i < j) of agents within proximity_threshold of each other.
+
+    Parameters:
+    positions (ndarray): (N, 2) agent coordinates.
+    proximity_threshold (float): Contact distance, exclusive.
+    backend (str): "dense" for the full distance matrix, "kdtree" for the spatial index.
+        With numba installed "kdtree" runs the compiled cell list instead, which finds the same pairs.
+    """
+    positions = np.asarray(positions, dtype=np.float64).reshape(-1, 2)
+    if backend == "dense":
+        pairs = densePairs(positions, proximity_threshold)
+    elif backend == "kdtree":
+        if kernels.ENABLED:
+            # Same pairs, already sorted.
+            pairs = kernels.cellPairs(positions, proximity_threshold)
+            if pairs is not None:
+                return pairs
+        pairs = kdtreePairs(positions, proximity_threshold)
+    else:
+        raise ValueError(f"Unknown contact backend: {backend}")
+    return _sortPairs(pairs)
+
+
+def bipartitePairs(positions, first, second, proximity_threshold=10):
+    """
+    Returns the contactPairs entries (i < j, sorted) that join an agent in first to an agent in second.
+
+    Only the smaller of the two sets is indexed. Agents of the larger set are
+    first cut down to those in grid cells next to an indexed agent, and only
+    they query the tree, so the cost follows the smaller set and its
+    neighborhoods rather than N.
+
+    Parameters:
+    positions (ndarray): (N, 2) agent coordinates.
+    first, second (ndarray): Disjoint agent indices.
+    proximity_threshold (float): Contact distance, exclusive.
+    """
+    positions = np.asarray(positions, dtype=np.float64).reshape(-1, 2)
+    first = np.asarray(first, dtype=np.intp)
+    second = np.asarray(second, dtype=np.intp)
+    if len(first) == 0 or len(second) == 0 or proximity_threshold <= 0:
+        return np.empty((0, 2), dtype=np.intp)
+    small, large = (first, second) if len(first) <= len(second) else (second, first)
+    small_xy = positions[small]
+
+    # Anything within the threshold of an indexed agent lies in its grid cell or one of the 8 around it.
+    # Cells are offset by 2 so the outermost ring of the grid stays empty, and larger-set agents
+    # outside the indexed agents' bounding box can be clipped onto it.
+    low = small_xy.min(axis=0)
+    small_cells = ((small_xy - low) // proximity_threshold).astype(np.intp) + 2
+    shape = small_cells.max(axis=0) + 3
+    large_rows = np.clip((positions[large, 0] - low[0]) // proximity_threshold + 2, 0, shape[0] - 1).astype(np.intp)
+    large_columns = np.clip((positions[large, 1] - low[1]) // proximity_threshold + 2, 0, shape[1] - 1).astype(np.intp)
+    if shape[0] * shape[1] <= 16 * len(positions) + 4096:
+        occupied = np.zeros(shape, dtype=bool)
+        for dx in (-1, 0, 1):
+            for dy in (-1, 0, 1):
+                occupied[small_cells[:, 0] + dx, small_cells[:, 1] + dy] = True
+        candidates = occupied[large_rows, large_columns]
+    else:
+        # Too sparse for a dense grid over the bounding box, match cell keys instead.
+        neighborhood = np.concatenate([
+            (small_cells[:, 0] + dx) * shape[1] + (small_cells[:, 1] + dy)
+            for dx in (-1, 0, 1) for dy in (-1, 0, 1)
+        ])
+        candidates = np.isin(large_rows * shape[1] + large_columns, neighborhood)
+    large = large[candidates]
+    large_xy = positions[large]
+    if len(large) == 0:
+        return np.empty((0, 2), dtype=np.intp)
+
+    found = cKDTree(small_xy).query_ball_point(large_xy, proximity_threshold)
+    lengths = np.fromiter(map(len, found), dtype=np.intp, count=len(found))
+    small_hits = small[np.fromiter(itertools.chain.from_iterable(found), dtype=np.intp, count=lengths.sum())]
+    large_hits = np.repeat(large, lengths)
+    # Same strict "<" test as kdtreePairs.
+    distances = minkowski_distance(positions[small_hits], positions[large_hits])
+    close = distances < proximity_threshold
+    small_hits, large_hits = small_hits[close], large_hits[close]
+    pairs = np.column_stack((np.minimum(small_hits, large_hits), np.maximum(small_hits, large_hits)))
+    return _sortPairs(pairs)
+
+
+def neighborLists(pairs, num_agents):
+    """Turns contact pairs into CSR-style (offsets, neighbors) arrays with both directions of every pair."""
+    rows = np.concatenate((pairs[:, 0], pairs[:, 1]))
+    cols = np.concatenate((pairs[:, 1], pairs[:, 0]))
+    order = np.argsort(rows, kind="stable")
+    offsets = np.zeros(num_agents + 1, dtype=np.intp)
+    np.cumsum(np.bincount(rows, minlength=num_agents), out=offsets[1:])
+    return offsets, cols[order]
+
+
+def checkBackends(sizes=(2, 10, 100, 500), proximity_threshold=10, bounds=(0, 100), trials=5, seed=0):
+    """Checks that every backend finds exactly the pairs the dense distance matrix finds."""
+    rng = np.random.default_rng(seed)
+    for num_agents in sizes:
+        for _ in range(trials):
+            positions = rng.uniform(bounds[0], bounds[1], (num_agents, 2))
+            # Agents clipped to the boundary share coordinates, make sure ties are covered.
+            positions[: num_agents // 4, 0] = bounds[0]
+            expected = contactPairs(positions, proximity_threshold, "dense")
+            for backend in CONTACT_BACKENDS:
+                found = contactPairs(positions, proximity_threshold, backend)
+                if not np.array_equal(found, expected):
+                    raise AssertionError(
+                        f"{backend} found {len(found)} pairs, dense found {len(expected)} "
+                        f"(num_agents={num_agents})"
+                    )
+            if kernels.ENABLED:
+                found = kdtreePairs(positions, proximity_threshold)
+                if not np.array_equal(_sortPairs(found), expected):
+                    raise AssertionError(f"kdtreePairs disagrees with dense (num_agents={num_agents})")
+            for share in (0.05, 0.5, 0.95):
+                first = rng.random(num_agents) < share
+                between = first[expected[:, 0]] != first[expected[:, 1]]
+                found = bipartitePairs(positions, np.flatnonzero(first), np.flatnonzero(~first), proximity_threshold)
+                if not np.array_equal(found, expected[between]):
+                    raise AssertionError(
+                        f"bipartitePairs found {len(found)} pairs, dense found {int(between.sum())} "
+                        f"(num_agents={num_agents})"
+                    )
+    return True
+
+
+def _sortPairs(pairs):
+    pairs = np.asarray(pairs, dtype=np.intp).reshape(-1, 2)
+    order = np.lexsort((pairs[:, 1], pairs[:, 0]))
+    return pairs[order]
+
+
+if __name__ == "__main__":
+    checkBackends()
+    print("Contact backends agree with the dense distance matrix")
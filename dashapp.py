@@ -1,15 +1,33 @@
 import dash
-from dash import dcc, html, Input, Output, State
+from dash import dcc, html, Input, Output, State, ClientsideFunction
 import plotly.graph_objs as go
 import numpy as np
+import base64
+import logging
+import os
 
-from simulation import Agent, moveAgents, rollInfect, trackCounts, getPosition, getInfected
+from cache import DEFAULT_CACHE_DIR, ResultCache
+from jobs import JobManager
+from profiling import StepProfiler
+from store import newSessionId, openSessionStore
 
 
 app = dash.Dash(__name__)
 
+# Runs are seeded so identical settings are reproducible and served from the result cache.
+DEFAULT_SEED = 0
+
+# Set SIMULATION_PROFILE=1 to log a per-phase timing report for every run the dashboard computes.
+PROFILE_RUNS = bool(os.environ.get('SIMULATION_PROFILE'))
+if PROFILE_RUNS:
+    # JobManager logs each run's report at INFO level.
+    logging.basicConfig()
+    logging.getLogger('jobs').setLevel(logging.INFO)
+
 
 app.layout = html.Div([
+    # Only this id travels with each callback; the session's state lives server-side in session_store.
+    dcc.Store(id='session-id', storage_type='session'),
     html.H1("MSDS 460 Final Project: Agent-Based Disease Simulation Dashboard"),
     
     html.Div([
@@ -58,7 +76,27 @@ app.layout = html.Div([
                 marks={i: str(i) for i in range(0, 1001, 200)}
             ),
             
+            html.Label("Random Seed:"),
+            dcc.Input(id='seed-input', type='number', min=0, step=1, value=DEFAULT_SEED),
+
+            html.Label("Infection Mode:"),
+            dcc.RadioItems(
+                id='infection-mode',
+                options=[{'label': 'Sequential', 'value': 'sequential'},
+                         {'label': 'Per contact', 'value': 'contact'},
+                         {'label': 'Per agent', 'value': 'agent'}],
+                value='sequential', inline=True
+            ),
+
             html.Button('Run Simulation', id='run-button', n_clicks=0),
+            html.Button('Cancel', id='cancel-button', n_clicks=0),
+            html.Div(id='job-status'),
+            dcc.Interval(
+                id='progress-interval',
+                interval=250,
+                n_intervals=0,
+                disabled=True
+            ),
         ], style={'width': '30%', 'padding': '20px', 'display': 'inline-block', 'vertical-align': 'top'}),
         
         html.Div([
@@ -66,6 +104,13 @@ app.layout = html.Div([
             
             dcc.Tabs([
                 dcc.Tab(label='Current State', children=[
+                    dcc.RadioItems(
+                        id='render-mode',
+                        options=[{'label': 'Auto', 'value': 'auto'},
+                                 {'label': 'Points', 'value': 'points'},
+                                 {'label': 'Density', 'value': 'density'}],
+                        value='auto', inline=True
+                    ),
                     dcc.Graph(id='current-state-graph')
                 ]),
                 dcc.Tab(label='Disease Progression', children=[
@@ -85,7 +130,12 @@ app.layout = html.Div([
                             interval=200, 
                             n_intervals=0,
                             disabled=True
-                        )
+                        ),
+                        # Frames are sent once per run and played back in the browser (assets/animation.js).
+                        dcc.Store(id='animation-data'),
+                        # The run_id of the frames the browser holds; like them it is gone after a reload.
+                        dcc.Store(id='animation-run'),
+                        dcc.Store(id='animation-state', data={'frame': 0, 'playing': False})
                     ])
                 ])
             ])
@@ -93,150 +143,305 @@ app.layout = html.Div([
     ])
 ])
 
-simulation_data = {
-    'frames': [],
-    'statistics': [],
-    'current_frame': 0,
-    'playing': False
+result_cache = ResultCache(os.environ.get('SIMULATION_CACHE_DIR') or DEFAULT_CACHE_DIR)
+job_manager = JobManager(result_cache)
+# Set SIMULATION_SESSION_DB to an SQLite path shared by every worker process (e.g. under gunicorn);
+# without it sessions live in this process only.
+session_store = openSessionStore(os.environ.get('SIMULATION_SESSION_DB'))
+
+# Per-session state is kept small and JSON-able; frames and statistics stay in the job or the result cache.
+NEW_SESSION = {
+    'job_id': None,
+    'params': None,
+    'seed': None,
+    'cancel_requested': False
 }
 
+# Raw bytes of animation frames sent to the browser per run (9 per agent per frame);
+# longer recordings are thinned to every k-th frame to fit.
+ANIMATION_MAX_BYTES = 64 * 2 ** 20
+
+PLOT_BOUNDS = (0, 500)
+# create_state_figure draws SVG markers up to SVG_MAX_POINTS agents in view, WebGL
+# markers up to WEBGL_MAX_POINTS, and in 'auto' mode per-state density beyond that.
+RENDER_MODES = ('auto', 'points', 'density')
+SVG_MAX_POINTS = 5000
+WEBGL_MAX_POINTS = 200000
+DENSITY_BINS = 200
+
 @app.callback(
     [Output('current-state-graph', 'figure'),
      Output('disease-progression-graph', 'figure'),
-     Output('animation-frame', 'figure'),
-     Output('frame-indicator', 'children'),
-     Output('animation-interval', 'disabled')],
+     Output('animation-data', 'data'),
+     Output('animation-run', 'data'),
+     Output('progress-interval', 'disabled'),
+     Output('job-status', 'children'),
+     Output('session-id', 'data')],
     [Input('run-button', 'n_clicks'),
-     Input('prev-button', 'n_clicks'),
-     Input('next-button', 'n_clicks'),
-     Input('play-button', 'n_clicks'),
-     Input('animation-interval', 'n_intervals')],
+     Input('cancel-button', 'n_clicks'),
+     Input('progress-interval', 'n_intervals'),
+     Input('render-mode', 'value'),
+     Input('current-state-graph', 'relayoutData')],
     [State('num-agents-slider', 'value'),
      State('initial-infected-slider', 'value'),
      State('resistance-slider', 'value'),
      State('proximity-slider', 'value'),
      State('step-size-slider', 'value'),
      State('timesteps-slider', 'value'),
-     State('animation-interval', 'disabled')]
+     State('seed-input', 'value'),
+     State('infection-mode', 'value'),
+     State('animation-run', 'data'),
+     State('session-id', 'data')]
 )
-def update_simulation(run_clicks, prev_clicks, next_clicks, play_clicks, 
-                     n_intervals, num_agents, num_initial_infected, 
-                     resistance, proximity, step_size, timesteps, interval_disabled):
+def update_simulation(run_clicks, cancel_clicks, progress_intervals, render_mode, relayout_data, num_agents, num_initial_infected, 
+                     resistance, proximity, step_size, timesteps, seed, infection_mode, browser_run_id, session_id):
     ctx = dash.callback_context
     trigger_id = ctx.triggered[0]['prop_id'].split('.')[0] if ctx.triggered else 'no-trigger'
+
+    session_id = session_id or newSessionId()
+    stored = session_store.get(session_id)
+    session = stored or dict(NEW_SESSION)
+    # Progress ticks run alongside Run and Cancel clicks, so only the handler that changes the session writes it.
+    changed = stored is None
     
     if run_clicks == 0 and trigger_id == 'run-button':
 
         empty_fig = go.Figure()
         empty_fig.update_layout(title="Run simulation to see results")
-        return empty_fig, empty_fig, empty_fig, "No simulation data", True
+        return empty_fig, empty_fig, dash.no_update, dash.no_update, True, "", session_id
     
 
     if trigger_id == 'run-button':
-        simulation_data['current_frame'] = 0
-        simulation_data['playing'] = False
-        
-        agents = []
-        bounds = (0, 500)
-        for i in range(num_agents):
-            x = np.random.uniform(bounds[0], bounds[1])
-            y = np.random.uniform(bounds[0], bounds[1])
-            agents.append(Agent(x, y, False, resistance))
-
-        for i in range(min(num_initial_infected, num_agents)):
-            agents[i].infected = True
-            agents[i].infectedCounter = 50
-
-        frames = []
-        statistics = []
-        
+        params = {
+            'num_agents': num_agents,
+            'num_initial_infected': num_initial_infected,
+            'resistance': resistance,
+            'proximity': proximity,
+            'step_size': step_size,
+            'timesteps': timesteps,
+            'vaccination_rate': 0,
+            'vaccination_step': -1,
+            'infection_mode': infection_mode or 'sequential',
+        }
+        seed = DEFAULT_SEED if seed is None else int(seed)
+        profiler = StepProfiler() if PROFILE_RUNS else None
+        if session['job_id'] is not None:
+            job_manager.cancel(session['job_id'])
+        session['job_id'] = job_manager.submit(params, seed, profiler).id
+        session['params'] = params
+        session['seed'] = seed
+        session['cancel_requested'] = False
+        changed = True
+    elif trigger_id == 'cancel-button' and session['job_id'] is not None:
+        session['cancel_requested'] = True
+        changed = True
 
-        for i in range(timesteps):
-            agents = moveAgents(agents, step_size, bounds, bounds)
-            agents = rollInfect(agents, proximity)
-            positions = getPosition(agents)
-            infected = getInfected(agents)
-            
-            frames.append((positions, infected, [agent.immunity for agent in agents]))
-            infected_count, immune_count, healthy_count = trackCounts(agents)
-            statistics.append((infected_count, immune_count, healthy_count))
+    frames, statistics, job_status, progress_disabled = load_run(session)
 
-        simulation_data['frames'] = frames
-        simulation_data['statistics'] = statistics
-    
-
-    elif trigger_id == 'play-button' and simulation_data['frames']:
-        simulation_data['playing'] = not simulation_data['playing']
-    elif trigger_id == 'next-button' and simulation_data['frames']:
-        simulation_data['current_frame'] = min(simulation_data['current_frame'] + 1, len(simulation_data['frames']) - 1)
-    elif trigger_id == 'prev-button' and simulation_data['frames']:
-        simulation_data['current_frame'] = max(simulation_data['current_frame'] - 1, 0)
-    elif trigger_id == 'animation-interval' and simulation_data['frames'] and simulation_data['playing']:
+    # The animation only changes when a run finishes, so its frames are sent once per run and page load.
+    animation_data = animation_run = dash.no_update
+    if progress_disabled and frames and browser_run_id != session['job_id']:
+        animation_data = encode_animation(frames, session['job_id'])
+        animation_run = session['job_id']
 
-        if simulation_data['current_frame'] >= len(simulation_data['frames']) - 1:
-            simulation_data['current_frame'] = 0
-        else:
-            simulation_data['current_frame'] += 1
+    if changed:
+        # A Run click handled meanwhile has started a newer job, which a Cancel click must not overwrite.
+        current = session_store.get(session_id)
+        if trigger_id != 'cancel-button' or current is None or current['job_id'] == session['job_id']:
+            session_store.set(session_id, session)
     
-    if not simulation_data['frames']:
+    if not frames or not statistics:
         empty_fig = go.Figure()
-        empty_fig.update_layout(title="Run simulation to see results")
-        return empty_fig, empty_fig, empty_fig, "No simulation data", True
+        empty_fig.update_layout(title="Simulation starting..." if not progress_disabled else "Run simulation to see results")
+        return empty_fig, empty_fig, animation_data, animation_run, progress_disabled, job_status, session_id
     
 
-    last_frame = simulation_data['frames'][-1]
-    current_fig = create_state_figure(last_frame, "Current State (Last Timestep)")
+    last_frame = frames[-1]
+    current_title = "Current State (Last Timestep)" if progress_disabled else f"Current State (Timestep {len(frames)})"
+    current_fig = create_state_figure(last_frame, current_title, render_mode, view_range(relayout_data))
     
+    # Zooming or switching the render mode only redraws the current state.
+    if trigger_id in ('render-mode', 'current-state-graph'):
+        return current_fig, dash.no_update, animation_data, animation_run, progress_disabled, job_status, session_id
 
-    progression_fig = create_progression_figure(simulation_data['statistics'], timesteps)
-
-    current_frame_idx = simulation_data['current_frame']
-    animation_fig = create_state_figure(
-        simulation_data['frames'][current_frame_idx], 
-        f"Timestep: {current_frame_idx + 1}"
-    )
-    frame_indicator = f"Frame {current_frame_idx + 1} of {len(simulation_data['frames'])}"
-    interval_disabled = not simulation_data['playing']
+    progression_fig = create_progression_figure(statistics, timesteps)
     
-    return current_fig, progression_fig, animation_fig, frame_indicator, interval_disabled
+    return current_fig, progression_fig, animation_data, animation_run, progress_disabled, job_status, session_id
+
+# Playback (Previous/Next/Play and the 200 ms ticks) runs in the browser and never calls the server.
+app.clientside_callback(
+    ClientsideFunction(namespace='animation', function_name='update'),
+    [Output('animation-frame', 'figure'),
+     Output('frame-indicator', 'children'),
+     Output('animation-interval', 'disabled'),
+     Output('animation-state', 'data')],
+    [Input('animation-data', 'data'),
+     Input('prev-button', 'n_clicks'),
+     Input('next-button', 'n_clicks'),
+     Input('play-button', 'n_clicks'),
+     Input('animation-interval', 'n_intervals')],
+    [State('animation-state', 'data')]
+)
+
+def encode_animation(frames, run_id, max_bytes=ANIMATION_MAX_BYTES):
+    """
+    Packs a recording for client-side playback: base64 float32 positions
+    (frames, N, 2) and the recorder's packed uint8 state codes (frames, N).
+
+    Parameters:
+    frames: A FrameReader or FrameRecorder.
+    run_id (str): Lets the browser tell a new run's frames from the ones it has decoded.
+    max_bytes (int): Frames are thinned to every k-th one to stay under this many raw bytes.
+
+    Returns:
+    dict: JSON-able payload for the animation-data store.
+    """
+    num_frames = len(frames)
+    positions = frames.positions[:num_frames]
+    states = frames.states[:num_frames]
+    frame_bytes = states.shape[1] * 9
+    stride = max(1, -(-num_frames * frame_bytes // max_bytes))
+    steps = np.arange(num_frames) * getattr(frames, 'stride', 1)
+    return {
+        'run_id': run_id,
+        'num_frames': len(range(0, num_frames, stride)),
+        'num_agents': int(states.shape[1]),
+        'steps': steps[::stride].tolist(),
+        'bounds': list(PLOT_BOUNDS),
+        'svg_max_points': SVG_MAX_POINTS,
+        'positions': base64.b64encode(np.ascontiguousarray(positions[::stride], dtype='<f4')).decode('ascii'),
+        'states': base64.b64encode(np.ascontiguousarray(states[::stride], dtype=np.uint8)).decode('ascii'),
+    }
+
+def load_run(session):
+    """
+    Looks up the frames and statistics of a session's run: from the job while this
+    process is running it, otherwise from the shared result cache once it is done.
 
-def create_state_figure(frame_data, title):
+    Returns:
+    tuple: (frames, statistics as a list of tuples, job status text, whether polling can stop)
+    """
+    if session['job_id'] is None:
+        return [], [], "", True
+    job = job_manager.get(session['job_id'])
+    if job is not None:
+        if session['cancel_requested'] and not job.finished:
+            job.cancel()
+        frames = job.frames() or []
+        statistics = [tuple(counts) for counts in job.statistics()]
+        return frames, statistics, describe_job(job), job.finished
+    # The run belongs to another worker process (or to a restart of this one).
+    result = result_cache.get(session['params'], session['seed'], frames=True)
+    if result is not None and 'frames' in result:
+        statistics = [tuple(counts) for counts in result['statistics']]
+        return result['frames'], statistics, f"Done: {len(statistics)} steps", True
+    if session['cancel_requested']:
+        return [], [], "Cancelling", False
+    return [], [], "Running in another worker", False
+
+def describe_job(job):
+    if job is None:
+        return ""
+    if job.status == 'queued':
+        return "Queued"
+    if job.status == 'running':
+        return f"Running: step {job.steps_done} of {job.timesteps}"
+    if job.status == 'cancelled':
+        return f"Cancelled after {job.steps_done} steps"
+    if job.status == 'failed':
+        return f"Failed: {job.error}"
+    return f"Done: {job.steps_done} steps"
+
+def view_range(relayout_data):
+    """
+    The (x range, y range) a graph is zoomed to, read from its relayoutData.
+
+    Returns:
+    tuple: ((x0, x1), (y0, y1)), or None when the graph shows the whole plane.
+    """
+    if not relayout_data:
+        return None
+    ranges = []
+    for axis in ('xaxis', 'yaxis'):
+        if f'{axis}.range[0]' in relayout_data:
+            ranges.append((relayout_data[f'{axis}.range[0]'], relayout_data[f'{axis}.range[1]']))
+        elif f'{axis}.range' in relayout_data:
+            ranges.append(tuple(relayout_data[f'{axis}.range']))
+        else:
+            ranges.append(None)
+    if ranges == [None, None]:
+        return None
+    return tuple(tuple(sorted(axis_range)) if axis_range else PLOT_BOUNDS for axis_range in ranges)
+
+def create_state_figure(frame_data, title, render_mode='auto', view=None):
+    """
+    Plots one frame, choosing how to draw it from the number of agents in view.
+
+    Parameters:
+    frame_data (tuple): (positions, infected, immunity).
+    title (str): Figure title.
+    render_mode (str): 'points' draws every visible agent as a marker (WebGL above
+        SVG_MAX_POINTS), 'density' draws a per-state 2D histogram of the visible
+        agents, and 'auto' switches to density above WEBGL_MAX_POINTS.
+    view (tuple): ((x0, x1), (y0, y1)) zoom range from view_range(); only agents inside
+        it are sent, so zooming in on a large run brings back individual markers.
+    """
     positions, infected, immunity = frame_data
     fig = go.Figure()
 
-    positions_np = np.array(positions)
-    infected_np = np.array(infected)
-    immunity_np = np.array(immunity)
+    positions_np = np.asarray(positions)
+    infected_np = np.asarray(infected, dtype=bool)
+    immunity_np = np.asarray(immunity, dtype=bool)
+    (x0, x1), (y0, y1) = view or (PLOT_BOUNDS, PLOT_BOUNDS)
 
-    infected_pos = positions_np[infected_np]
-    immune_pos = positions_np[immunity_np]
-    healthy_pos = positions_np[~infected_np & ~immunity_np]
-    
-    if len(infected_pos) > 0:
-        fig.add_trace(go.Scatter(
-            x=infected_pos[:, 0], y=infected_pos[:, 1], 
-            mode='markers', name='Infected',
-            marker=dict(color='red', size=8)
-        ))
-    
-    if len(immune_pos) > 0:
-        fig.add_trace(go.Scatter(
-            x=immune_pos[:, 0], y=immune_pos[:, 1], 
-            mode='markers', name='Immune',
-            marker=dict(color='blue', size=8)
-        ))
-    
-    if len(healthy_pos) > 0:
-        fig.add_trace(go.Scatter(
-            x=healthy_pos[:, 0], y=healthy_pos[:, 1], 
-            mode='markers', name='Healthy',
-            marker=dict(color='green', size=8)
-        ))
+    if view is not None:
+        x, y = positions_np[:, 0], positions_np[:, 1]
+        visible = (x >= x0) & (x <= x1) & (y >= y0) & (y <= y1)
+        positions_np = positions_np[visible]
+        infected_np = infected_np[visible]
+        immunity_np = immunity_np[visible]
+
+    # Drawn in this order so infected agents stay on top in crowds.
+    states = [
+        ('Healthy', 'green', (0, 128, 0), ~infected_np & ~immunity_np),
+        ('Immune', 'blue', (0, 0, 255), immunity_np),
+        ('Infected', 'red', (255, 0, 0), infected_np),
+    ]
+    num_visible = len(positions_np)
+
+    if render_mode == 'density' or (render_mode == 'auto' and num_visible > WEBGL_MAX_POINTS):
+        for name, _, rgb, mask in states:
+            counts, x_edges, y_edges = np.histogram2d(
+                positions_np[mask, 0], positions_np[mask, 1],
+                bins=DENSITY_BINS, range=[[x0, x1], [y0, y1]]
+            )
+            if not counts.any():
+                continue
+            # Empty bins become gaps so the states underneath show through.
+            counts = counts.astype(np.float32)
+            counts[counts == 0] = np.nan
+            fig.add_trace(go.Heatmap(
+                z=counts.T, x=(x_edges[:-1] + x_edges[1:]) / 2, y=(y_edges[:-1] + y_edges[1:]) / 2,
+                name=name, showlegend=True, showscale=False, opacity=0.7,
+                colorscale=[[0, 'rgba(%d,%d,%d,0.2)' % rgb], [1, 'rgba(%d,%d,%d,1)' % rgb]],
+                hovertemplate=f'{name}: %{{z}}<extra></extra>'
+            ))
+    else:
+        scatter = go.Scatter if num_visible <= SVG_MAX_POINTS else go.Scattergl
+        size = 8 if num_visible <= SVG_MAX_POINTS else 3
+        for name, color, _, mask in reversed(states):
+            if not mask.any():
+                continue
+            fig.add_trace(scatter(
+                x=positions_np[mask, 0], y=positions_np[mask, 1],
+                mode='markers', name=name,
+                marker=dict(color=color, size=size)
+            ))
     
     fig.update_layout(
         title=title,
-        xaxis=dict(range=[0, 500], showticklabels=False), 
-        yaxis=dict(range=[0, 500], showticklabels=False),
+        xaxis=dict(range=[x0, x1], showticklabels=False), 
+        yaxis=dict(range=[y0, y1], showticklabels=False),
         height=500
     )
     
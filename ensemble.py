@@ -0,0 +1,109 @@
+import argparse
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+import kernels
+from simulation import simulateCounts
+
+COUNT_NAMES = ("infected", "immune", "healthy")
+DEFAULT_QUANTILES = (0.05, 0.25, 0.5, 0.75, 0.95)
+
+
+def _runReplicate(job):
+    params, seed_sequence = job
+    return simulateCounts(rng=np.random.default_rng(seed_sequence), **params)
+
+
+def _runChunk(jobs):
+    # One task per chunk keeps pickling and scheduling overhead per process, not per replicate.
+    return np.stack([_runReplicate(job) for job in jobs])
+
+
+def runReplicates(replicates=100, seed=None, workers=None, **params):
+    """
+    Runs independent replicates of simulateCounts across a process pool.
+
+    Each replicate gets its own Generator spawned from np.random.SeedSequence(seed),
+    so results depend only on the seed and the replicate index, not on the number
+    of workers or the order replicates finish in.
+
+    Returns:
+    ndarray: (replicates, timesteps, 3) int array of trackCounts.
+    """
+    children = np.random.SeedSequence(seed).spawn(replicates)
+    jobs = [(params, child) for child in children]
+    if workers is None:
+        workers = os.cpu_count() or 1
+    workers = max(1, min(workers, replicates))
+    if workers == 1:
+        return _runChunk(jobs)
+
+    chunks = [jobs[i::workers] for i in range(workers)]
+    counts = np.empty((replicates, params.get("timesteps", 500), 3), dtype=np.int64)
+    with ProcessPoolExecutor(max_workers=workers, mp_context=kernels.poolContext()) as pool:
+        for i, chunk_counts in enumerate(pool.map(_runChunk, chunks)):
+            counts[i::workers] = chunk_counts
+    return counts
+
+
+def summarize(counts, quantiles=DEFAULT_QUANTILES):
+    """
+    Aggregates replicate counts into mean and quantile time series.
+
+    Returns:
+    dict: "mean" and "std" are (timesteps, 3), "quantiles" is (len(quantiles), timesteps, 3),
+        with columns ordered as COUNT_NAMES.
+    """
+    counts = np.asarray(counts, dtype=np.float64)
+    return {
+        "replicates": len(counts),
+        "quantile_levels": np.asarray(quantiles, dtype=np.float64),
+        "mean": counts.mean(axis=0),
+        "std": counts.std(axis=0),
+        "quantiles": np.quantile(counts, quantiles, axis=0),
+    }
+
+
+def run_ensemble(replicates=100, seed=None, workers=None, quantiles=DEFAULT_QUANTILES, **params):
+    """Runs replicates in parallel and returns their summarize() statistics."""
+    return summarize(runReplicates(replicates, seed, workers, **params), quantiles)
+
+
+def saveSummary(summary, path):
+    np.savez_compressed(path, **summary)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Run Monte Carlo replicates of the disease simulation in parallel.")
+    parser.add_argument("--replicates", type=int, default=100)
+    parser.add_argument("--workers", type=int, default=None, help="Worker processes (default: all cores)")
+    parser.add_argument("--seed", type=int, default=None)
+    parser.add_argument("--num-agents", type=int, default=500)
+    parser.add_argument("--initial-infected", type=int, default=10)
+    parser.add_argument("--resistance", type=float, default=0.3)
+    parser.add_argument("--step-size", type=float, default=5)
+    parser.add_argument("--timesteps", type=int, default=500)
+    parser.add_argument("--proximity", type=float, default=10)
+    parser.add_argument("--vaccination-rate", type=float, default=0.2)
+    parser.add_argument("--vaccination-step", type=int, default=100)
+    parser.add_argument("--quantiles", type=float, nargs="+", default=list(DEFAULT_QUANTILES))
+    parser.add_argument("--output", default="ensemble_stats.npz")
+    args = parser.parse_args(argv)
+
+    summary = run_ensemble(
+        replicates=args.replicates, seed=args.seed, workers=args.workers, quantiles=args.quantiles,
+        num_agents=args.num_agents, num_initial_infected=args.initial_infected,
+        resistance=args.resistance, step_size=args.step_size, timesteps=args.timesteps,
+        proximity=args.proximity, vaccination_rate=args.vaccination_rate,
+        vaccination_step=args.vaccination_step,
+    )
+    saveSummary(summary, args.output)
+    peak = summary["mean"][:, 0]
+    print(f"{summary['replicates']} replicates, mean peak infected {peak.max():.1f} at step {peak.argmax()}")
+    print(f"Statistics saved as {args.output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,316 @@
+import argparse
+import itertools
+import json
+import os
+
+import numpy as np
+
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+except ImportError:  # pyarrow is optional; without it runs are exported as CSV
+    pa = pq = None
+
+EXPORT_FORMATS = ("parquet", "csv")
+COUNT_COLUMNS = ("step", "infected", "immune", "healthy")
+EVENT_COLUMNS = ("step", "infector", "infectee")
+COUNTS_NAME = "counts"
+EVENTS_NAME = "events"
+META_FILE = "meta.json"
+DEFAULT_CHUNK_ROWS = 4096
+DEFAULT_MAX_EVENTS = 65536
+
+
+def defaultFormat():
+    return "parquet" if pq is not None else "csv"
+
+
+def tablePath(directory, name, format):
+    return os.path.join(directory, f"{name}.{format}")
+
+
+class _TableWriter:
+    """Appends chunks of int64 rows to one Parquet file (a row group per chunk) or CSV file."""
+
+    def __init__(self, path, columns, format):
+        self.columns = columns
+        self.format = format
+        if format == "parquet":
+            schema = pa.schema([(column, pa.int64()) for column in columns])
+            self._writer = pq.ParquetWriter(path, schema)
+        else:
+            self._file = open(path, "w")
+            self._file.write(",".join(columns) + "\n")
+
+    def write(self, rows):
+        if len(rows) == 0:
+            return
+        if self.format == "parquet":
+            arrays = [pa.array(rows[:, column]) for column in range(len(self.columns))]
+            self._writer.write_table(pa.Table.from_arrays(arrays, names=list(self.columns)))
+        else:
+            np.savetxt(self._file, rows, fmt="%d", delimiter=",")
+
+    def close(self):
+        if self.format == "parquet":
+            self._writer.close()
+        else:
+            self._file.close()
+
+
+class RunExporter:
+    """
+    Streams a run's per-step compartment counts, and with events=True every infection
+    as (step, infector, infectee), into columnar files in directory: counts and events
+    tables (.parquet, or .csv without pyarrow) plus meta.json. RunData reads them back.
+
+    At most chunk_rows steps and max_events events are buffered; every flush
+    appends one Parquet row group or one block of CSV lines, so memory stays
+    bounded however long the run. An infector of -1 means the source is unknown.
+
+    A run resumed from a checkpoint attaches with the checkpoint's step and
+    statistics: its counts are written first, and when directory holds the
+    export of the run that saved the checkpoint, that export's events before
+    the step are kept. Otherwise events start at the step, noted in meta.json.
+
+    Parameters:
+    directory (str): Output directory, created if missing.
+    format (str): "parquet" or "csv"; parquet when pyarrow is installed.
+    events (bool): Log infection events from the attached Population.
+    """
+
+    def __init__(self, directory, format=None, events=False, chunk_rows=DEFAULT_CHUNK_ROWS,
+                 max_events=DEFAULT_MAX_EVENTS):
+        format = format or defaultFormat()
+        if format not in EXPORT_FORMATS:
+            raise ValueError(f"Unknown export format: {format}")
+        if format == "parquet" and pq is None:
+            raise ValueError("Parquet export needs pyarrow, use format='csv'")
+        os.makedirs(directory, exist_ok=True)
+        self.directory = directory
+        self.format = format
+        self.events = events
+        self.max_events = max_events
+        self.steps = 0
+        self.num_events = 0
+        self._counts = np.empty((chunk_rows, len(COUNT_COLUMNS)), dtype=np.int64)
+        self._count_rows = 0
+        self._events = []
+        self._event_rows = 0
+        self._step = 0
+        self.events_from = 0
+        self._population = None
+        self._count_writer = self._event_writer = None
+
+    def _open(self, step=0):
+        if self._count_writer is not None:
+            return
+        previous_events = None
+        if step > 0 and self.events and RunData.exists(self.directory):
+            previous = RunData(self.directory)
+            if previous.has_events and previous.format == self.format and previous.events_from <= step:
+                # Moved aside first: the new events file replaces it.
+                previous_events = tablePath(self.directory, EVENTS_NAME + ".previous", self.format)
+                os.replace(tablePath(self.directory, EVENTS_NAME, self.format), previous_events)
+        self._count_writer = _TableWriter(tablePath(self.directory, COUNTS_NAME, self.format), COUNT_COLUMNS,
+                                          self.format)
+        if not self.events:
+            return
+        self._event_writer = _TableWriter(tablePath(self.directory, EVENTS_NAME, self.format), EVENT_COLUMNS,
+                                          self.format)
+        self.events_from = step
+        if previous_events is None:
+            return
+        for chunk in _readChunks(previous_events, self.format, EVENT_COLUMNS, self.max_events):
+            chunk = chunk[chunk[:, 0] < step]
+            self._event_writer.write(chunk)
+            self.num_events += len(chunk)
+        os.remove(previous_events)
+        self.events_from = previous.events_from
+
+    def attach(self, population, step=0, statistics=None):
+        """
+        Logs the population's infections, from step on, until close().
+        statistics holds the counts of the steps before step, as a checkpoint does.
+        """
+        self._open(step)
+        for earlier, counts in enumerate([] if statistics is None else statistics):
+            self.record(earlier, counts)
+        self._step = step
+        if self.events:
+            self._population = population
+            population.onInfection = self._infected
+
+    def _infected(self, indices, infectors):
+        indices = np.atleast_1d(np.asarray(indices, dtype=np.int64))
+        if infectors is None:
+            infectors = -1
+        rows = np.empty((len(indices), len(EVENT_COLUMNS)), dtype=np.int64)
+        rows[:, 0] = self._step
+        rows[:, 1] = infectors
+        rows[:, 2] = indices
+        self._events.append(rows)
+        self._event_rows += len(rows)
+        if self._event_rows >= self.max_events:
+            self._flushEvents()
+
+    def record(self, step, counts):
+        """Adds the (infected, immune, healthy) counts after step; later infections belong to step + 1."""
+        self._open()
+        self._counts[self._count_rows] = (step, *counts)
+        self._count_rows += 1
+        self.steps += 1
+        self._step = step + 1
+        if self._count_rows == len(self._counts):
+            self._flushCounts()
+
+    def _flushCounts(self):
+        self._count_writer.write(self._counts[:self._count_rows])
+        self._count_rows = 0
+
+    def _flushEvents(self):
+        if self._events:
+            self._event_writer.write(np.concatenate(self._events))
+            self.num_events += self._event_rows
+        self._events = []
+        self._event_rows = 0
+
+    def flush(self):
+        self._flushCounts()
+        if self.events:
+            self._flushEvents()
+
+    def close(self):
+        self._open()
+        self.flush()
+        self._count_writer.close()
+        if self.events:
+            self._event_writer.close()
+        if self._population is not None:
+            self._population.onInfection = None
+            self._population = None
+        meta = {"format": self.format, "steps": self.steps, "events": self.events, "num_events": self.num_events,
+                "events_from": self.events_from}
+        with open(os.path.join(self.directory, META_FILE), "w") as meta_file:
+            json.dump(meta, meta_file)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+class RunData:
+    """
+    Lazy reader for a RunExporter directory. Nothing is read until asked for;
+    iterCounts() and iterEvents() yield (rows, columns) int64 chunks, so a long
+    run can be analysed without loading all of it.
+    """
+
+    def __init__(self, directory):
+        self.directory = directory
+        with open(os.path.join(directory, META_FILE)) as meta_file:
+            meta = json.load(meta_file)
+        self.format = meta["format"]
+        self.steps = meta["steps"]
+        self.has_events = meta["events"]
+        self.num_events = meta["num_events"]
+        # Events of a run resumed without its earlier export start at the resumed step.
+        self.events_from = meta.get("events_from", 0)
+
+    @staticmethod
+    def exists(directory):
+        return os.path.exists(os.path.join(directory, META_FILE))
+
+    def _chunks(self, name, columns, chunk_rows):
+        return _readChunks(tablePath(self.directory, name, self.format), self.format, columns, chunk_rows)
+
+    def iterCounts(self, chunk_rows=DEFAULT_CHUNK_ROWS):
+        """Chunks of COUNT_COLUMNS rows."""
+        return self._chunks(COUNTS_NAME, COUNT_COLUMNS, chunk_rows)
+
+    def iterEvents(self, chunk_rows=DEFAULT_MAX_EVENTS):
+        """Chunks of EVENT_COLUMNS rows, in the order the infections happened."""
+        if not self.has_events:
+            raise ValueError("This run was exported without events")
+        return self._chunks(EVENTS_NAME, EVENT_COLUMNS, chunk_rows)
+
+    def counts(self):
+        """(steps, 3) infected, immune, healthy counts, the statistics simulateRun returns."""
+        chunks = list(self.iterCounts())
+        if not chunks:
+            return np.empty((0, 3), dtype=np.int64)
+        return np.concatenate(chunks)[:, 1:]
+
+    def events(self, start=None, stop=None):
+        """(K, 3) events with start <= step < stop."""
+        chunks = []
+        for chunk in self.iterEvents():
+            keep = np.ones(len(chunk), dtype=bool)
+            if start is not None:
+                keep &= chunk[:, 0] >= start
+            if stop is not None:
+                keep &= chunk[:, 0] < stop
+            chunks.append(chunk[keep])
+        if not chunks:
+            return np.empty((0, len(EVENT_COLUMNS)), dtype=np.int64)
+        return np.concatenate(chunks)
+
+    def secondaryInfections(self, num_agents):
+        """How many agents each agent infected over the run, streamed over the events."""
+        infections = np.zeros(num_agents, dtype=np.int64)
+        for chunk in self.iterEvents():
+            known = chunk[:, 1] >= 0
+            infections += np.bincount(chunk[known, 1], minlength=num_agents)
+        return infections
+
+
+def _readChunks(path, format, columns, chunk_rows):
+    if format == "parquet":
+        for batch in pq.ParquetFile(path).iter_batches(batch_size=chunk_rows):
+            yield np.column_stack([batch.column(i).to_numpy() for i in range(len(columns))]).astype(np.int64)
+        return
+    with open(path) as table_file:
+        next(table_file)
+        while True:
+            lines = list(itertools.islice(table_file, chunk_rows))
+            if not lines:
+                return
+            yield np.loadtxt(lines, delimiter=",", dtype=np.int64, ndmin=2)
+
+
+def plot_statistics(statistics, path):
+    """Saves the infected, immune and healthy counts over time as a line plot."""
+    import matplotlib.pyplot as plt
+
+    statistics = np.asarray(statistics).reshape(-1, 3)
+    figure, axes = plt.subplots(figsize=(8, 5))
+    for column, (label, color) in enumerate((("Infected", "red"), ("Immune", "blue"), ("Healthy", "green"))):
+        axes.plot(statistics[:, column], label=label, color=color)
+    axes.set_xlabel("Step")
+    axes.set_ylabel("Agents")
+    axes.legend()
+    figure.savefig(path)
+    plt.close(figure)
+    print(f"Statistics plot saved as {path}")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Summarize and plot an exported simulation run.")
+    parser.add_argument("directory")
+    parser.add_argument("--plot", help="Save the counts over time to this image")
+    args = parser.parse_args(argv)
+
+    run = RunData(args.directory)
+    counts = run.counts()
+    peak = counts[:, 0]
+    print(f"{run.steps} steps, peak infected {peak.max()} at step {peak.argmax()}")
+    if run.has_events:
+        print(f"{run.num_events} infection events")
+    if args.plot:
+        plot_statistics(counts, args.plot)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,179 @@
+import numpy as np
+
+import kernels
+from contacts import bipartitePairs, neighborLists
+from population import RESISTANCE_GROWTH, randomSource
+
+INFECTION_MODES = ("sequential", "contact", "agent")
+
+
+def exposures(population, pairs, sources=False):
+    """
+    Returns the target index of every (susceptible, infected) contact, one entry per infected contact.
+
+    Parameters:
+    population (Population): Agent arrays.
+    pairs (ndarray): (M, 2) contact pairs from contacts.contactPairs.
+    sources (bool): Also return the infected agent of every contact, as a second array.
+    """
+    infected = population.infected
+    susceptible = ~(infected | population.immunity | population.vaccinated)
+    first, second = pairs[:, 0], pairs[:, 1]
+    first_exposed = susceptible[first] & infected[second]
+    second_exposed = susceptible[second] & infected[first]
+    targets = np.concatenate((first[first_exposed], second[second_exposed]))
+    if not sources:
+        return targets
+    return targets, np.concatenate((second[first_exposed], first[second_exposed]))
+
+
+def activePairs(population, proximity_threshold=10):
+    """
+    Contact pairs between infected and susceptible agents only, the only ones
+    batchInfect can act on, found by indexing whichever of the two sets is
+    smaller. batchInfect gets exactly the exposures, in the same order, that
+    the full contactPairs list gives it, so sparse outbreaks cost next to nothing.
+    """
+    infected = population.infected
+    susceptible = ~(infected | population.immunity | population.vaccinated)
+    return bipartitePairs(population.positions(), np.flatnonzero(infected), np.flatnonzero(susceptible),
+                          proximity_threshold)
+
+
+def batchInfect(population, pairs, mode="contact", rng=None):
+    """
+    Rolls infection for every exposed agent at once and returns the indices of the newly infected.
+
+    Every mode judges contacts against the infection state at the start of the
+    call, so an agent infected in this step does not pass it on until the next.
+
+    Modes:
+    "contact" draws one roll per infected contact, the same "roll > resistance"
+        test Agent.infect makes once per infected neighbor.
+    "agent" draws one roll per exposed agent against the combined probability
+        1 - resistance ** k for k infected neighbors. Same distribution as
+        "contact" with one draw per agent instead of per contact.
+
+    Parameters:
+    population (Population): Agent arrays, updated in place.
+    pairs (ndarray): (M, 2) contact pairs from contacts.contactPairs.
+    mode (str): "contact" or "agent".
+    rng (Generator): Random source, the global np.random state when None.
+    """
+    rng = randomSource(rng)
+    # Infectors are only worked out when someone listens for them.
+    tracking = population.onInfection is not None
+    if tracking:
+        targets, sources = exposures(population, pairs, sources=True)
+    else:
+        targets = exposures(population, pairs)
+    infectors = None
+    if mode == "contact":
+        rolls = rng.uniform(size=len(targets))
+        infectious = rolls > population.resistance[targets]
+        if tracking:
+            # Credit the first contact whose roll succeeded.
+            newly_infected, first = np.unique(targets[infectious], return_index=True)
+            infectors = sources[infectious][first]
+        else:
+            newly_infected = np.unique(targets[infectious])
+    elif mode == "agent":
+        counts = np.bincount(targets, minlength=len(population))
+        exposed = np.flatnonzero(counts)
+        escape = population.resistance[exposed] ** counts[exposed]
+        rolls = rng.uniform(size=len(exposed))
+        infectious = rolls > escape
+        newly_infected = exposed[infectious]
+        if tracking:
+            # One roll covers all of an agent's infected contacts; credit the first of them.
+            _, first = np.unique(targets, return_index=True)
+            infectors = sources[first][infectious]
+    else:
+        raise ValueError(f"Unknown infection mode: {mode}")
+
+    population.start_infections(newly_infected, infectors)
+    population.resistance[newly_infected] *= RESISTANCE_GROWTH
+    return newly_infected
+
+
+def networkInfect(population, network, pairs=None, rng=None):
+    """
+    The "agent" mode with a ContactNetwork mixed in: every susceptible agent with
+    k infected spatial contacts and network pressure w (the summed weights of its
+    infected network neighbors) draws one roll against resistance ** (k + w).
+    With no network edges this is batchInfect(mode="agent") exactly.
+
+    Parameters:
+    population (Population): Agent arrays, updated in place.
+    network (ContactNetwork): Household/workplace contacts.
+    pairs (ndarray): (M, 2) spatial contact pairs, or None for network contacts only.
+    rng (Generator): Random source, the global np.random state when None.
+    """
+    rng = randomSource(rng)
+    tracking = population.onInfection is not None
+    infected = population.infected
+    susceptible = ~(infected | population.immunity | population.vaccinated)
+    exposure = network.pressure(infected).astype(np.float64)
+    targets = np.empty(0, dtype=np.intp)
+    if pairs is not None:
+        if tracking:
+            targets, sources = exposures(population, pairs, sources=True)
+        else:
+            targets = exposures(population, pairs)
+        exposure += np.bincount(targets, minlength=len(population))
+    exposed = np.flatnonzero(susceptible & (exposure > 0))
+    escape = population.resistance[exposed] ** exposure[exposed]
+    rolls = rng.uniform(size=len(exposed))
+    newly_infected = exposed[rolls > escape]
+
+    infectors = None
+    if tracking:
+        # Credit the first infected spatial contact, else the first infected network neighbor.
+        infectors = np.full(len(newly_infected), -1, dtype=np.intp)
+        if len(targets):
+            spatial, first = np.unique(targets, return_index=True)
+            position = np.minimum(np.searchsorted(spatial, newly_infected), len(spatial) - 1)
+            matched = spatial[position] == newly_infected
+            infectors[matched] = sources[first[position[matched]]]
+        missing = infectors < 0
+        infectors[missing] = network.firstInfectedNeighbor(newly_infected[missing], infected)
+
+    population.start_infections(newly_infected, infectors)
+    population.resistance[newly_infected] *= RESISTANCE_GROWTH
+    return newly_infected
+
+
+def sequentialInfect(population, pairs, rng=None):
+    """
+    The in-order rollInfect loop as a compiled kernel: agents are visited in
+    index order and every infected neighbor of a still-susceptible agent costs
+    one roll, so an agent infected earlier in the step can infect later ones.
+
+    The rolls are drawn up front (at most one per neighbor entry), then the
+    random state is rewound and advanced by exactly the rolls used, leaving it
+    where the Python loop would.
+    """
+    rng = randomSource(rng)
+    offsets, neighbors = neighborLists(pairs, len(population))
+    state = _randomState(rng)
+    rolls = rng.uniform(size=len(neighbors))
+    used, newly_infected, infectors = kernels.sequentialInfect(offsets, neighbors, population, rolls)
+    _setRandomState(rng, state)
+    rng.uniform(size=used)
+    # The kernel only flips infected; start the infections properly so counters and the schedule follow.
+    population.infected[newly_infected] = False
+    population.start_infections(newly_infected, infectors)
+    population.resistance[newly_infected] *= RESISTANCE_GROWTH
+    return newly_infected
+
+
+def _randomState(rng):
+    # A Generator keeps its state on the bit generator, the legacy np.random module has get_state.
+    return rng.bit_generator.state if isinstance(rng, np.random.Generator) else rng.get_state()
+
+
+def _setRandomState(rng, state):
+    if isinstance(rng, np.random.Generator):
+        rng.bit_generator.state = state
+    else:
+        rng.set_state(state)
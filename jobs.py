@@ -0,0 +1,139 @@
+import logging
+import threading
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+QUEUED, RUNNING, DONE, CANCELLED, FAILED = "queued", "running", "done", "cancelled", "failed"
+FINISHED = (DONE, CANCELLED, FAILED)
+
+
+class SimulationCancelled(Exception):
+    pass
+
+
+class SimulationJob:
+    """
+    One background simulation run. Progress is readable while it runs: statistics()
+    returns the counts recorded so far and frames() the frames recorded so far.
+    """
+
+    def __init__(self, job_id, params, seed):
+        self.id = job_id
+        self.params = params
+        self.seed = seed
+        self.timesteps = params.get("timesteps", 500)
+        self.status = QUEUED
+        self.error = None
+        self._lock = threading.Lock()
+        self._cancel = threading.Event()
+        self._statistics = np.empty((0, 3), dtype=np.int64)
+        self._frames = None
+        self.result = None
+
+    def cancel(self):
+        self._cancel.set()
+
+    @property
+    def finished(self):
+        return self.status in FINISHED
+
+    @property
+    def steps_done(self):
+        return len(self._statistics)
+
+    def statistics(self):
+        with self._lock:
+            return self._statistics.copy()
+
+    def frames(self):
+        """The final FrameReader once done, the live FrameRecorder while running, else None."""
+        with self._lock:
+            return self._frames
+
+    def _onStart(self, recorder):
+        with self._lock:
+            self._frames = recorder
+
+    def _onStep(self, step, statistics):
+        if self._cancel.is_set():
+            raise SimulationCancelled()
+        with self._lock:
+            self._statistics = statistics
+
+    def _finish(self, status, result=None, error=None):
+        with self._lock:
+            if result is not None:
+                self.result = result
+                self._statistics = result["statistics"]
+                self._frames = result.get("frames")
+            self.error = error
+            self.status = status
+
+
+class JobManager:
+    """
+    Runs simulations through a ResultCache on a small thread pool so the Dash
+    callbacks that start them return immediately.
+
+    Parameters:
+    cache (ResultCache): Results are served from and stored in this cache.
+    max_workers (int): Simulations running at once; further jobs queue.
+    max_jobs (int): Finished jobs kept for polling before the oldest are dropped.
+    """
+
+    def __init__(self, cache, max_workers=2, max_jobs=64):
+        self.cache = cache
+        self.max_jobs = max_jobs
+        self._pool = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="simulation")
+        self._jobs = {}
+        self._lock = threading.Lock()
+
+    def submit(self, params, seed, profiler=None):
+        with self._lock:
+            # Globally unique so ids kept in a shared session store never collide across worker processes.
+            job = SimulationJob(uuid.uuid4().hex, params, seed)
+            self._jobs[job.id] = job
+            self._prune()
+        self._pool.submit(self._run, job, profiler)
+        return job
+
+    def get(self, job_id):
+        with self._lock:
+            return self._jobs.get(job_id)
+
+    def cancel(self, job_id):
+        job = self.get(job_id)
+        if job is not None:
+            job.cancel()
+        return job
+
+    def _run(self, job, profiler):
+        if job._cancel.is_set():
+            job._finish(CANCELLED)
+            return
+        job.status = RUNNING
+        try:
+            result = self.cache.fetch(job.params, job.seed, frames=True, profiler=profiler,
+                                      onStart=job._onStart, onStep=job._onStep)
+        except SimulationCancelled:
+            job._finish(CANCELLED)
+        except Exception as error:
+            job._finish(FAILED, error=repr(error))
+        else:
+            job._finish(DONE, result)
+            if profiler is not None and profiler.steps:
+                logger.info("Profile of job %s:\n%s", job.id, profiler.summary())
+
+    def _prune(self):
+        finished = [job_id for job_id, job in self._jobs.items() if job.finished]
+        for job_id in finished[:max(0, len(self._jobs) - self.max_jobs)]:
+            del self._jobs[job_id]
+
+    def shutdown(self):
+        for job in list(self._jobs.values()):
+            job.cancel()
+        self._pool.shutdown(wait=True)
@@ -0,0 +1,245 @@
+import os
+import threading
+import types
+
+import numpy as np
+
+try:
+    import numba
+except ImportError:  # numba is optional; every caller keeps its NumPy code path
+    numba = None
+
+# Compiled kernels replace the NumPy step code whenever numba is installed.
+# Set SIMULATION_NUMBA=0 to keep the NumPy code paths anyway, or SIMULATION_NUMBA=parallel
+# to also build multithreaded kernels; by default every kernel is compiled serial.
+ENABLED = numba is not None and os.environ.get("SIMULATION_NUMBA", "1") != "0"
+PARALLEL = ENABLED and os.environ.get("SIMULATION_NUMBA") == "parallel"
+
+prange = numba.prange if numba is not None else range
+
+# Cell lists need a cell per threshold-sized square of the agents' bounding box;
+# beyond this many cells per agent contact search stays with the KD-tree.
+MAX_CELLS_PER_AGENT = 4
+
+# Set in children forked from this process, which must not touch the parent's numba thread pool.
+_forked = False
+
+
+def _markForked():
+    global _forked
+    _forked = True
+
+
+if hasattr(os, "register_at_fork"):
+    os.register_at_fork(after_in_child=_markForked)
+
+
+def parallelAllowed():
+    """
+    Whether the parallel kernel builds may run here: only with PARALLEL, on the
+    main thread, in a process that was not forked. numba's threading layers
+    cannot be entered from several threads at once (workqueue aborts the
+    process) and a pool started before a fork hangs the child (TBB), so job
+    threads and forking pools always get the serial builds.
+    """
+    return PARALLEL and not _forked and threading.current_thread() is threading.main_thread()
+
+
+def poolContext():
+    """
+    multiprocessing context for process pools: spawn once parallel kernels may
+    have started numba's thread pool in this process, else the platform default.
+    """
+    if PARALLEL:
+        import multiprocessing
+        return multiprocessing.get_context("spawn")
+    return None
+
+
+class _Kernel:
+    """A serial build of a kernel and, when PARALLEL is set, a parallel one, picked per call."""
+
+    def __init__(self, function, parallel):
+        self.serial = numba.njit(parallel=False, cache=True)(function)
+        self.parallel = None
+        if parallel and PARALLEL:
+            # A copy under its own name, so the two builds get separate cache files.
+            copy = types.FunctionType(function.__code__, function.__globals__, function.__name__ + "_parallel",
+                                      function.__defaults__, function.__closure__)
+            copy.__qualname__ = function.__qualname__ + "_parallel"
+            self.parallel = numba.njit(parallel=True, cache=True)(copy)
+
+    def __call__(self, *args):
+        if self.parallel is not None and parallelAllowed():
+            return self.parallel(*args)
+        return self.serial(*args)
+
+
+def _jit(parallel=True):
+    """
+    numba.njit with cache=True, so compiled signatures are written next to this
+    module and later processes load them instead of compiling again. parallel
+    marks kernels whose prange loops may run multithreaded under PARALLEL.
+    Without numba the plain Python function is kept (and never called).
+    """
+    def decorate(function):
+        if numba is None:
+            return function
+        return _Kernel(function, parallel)
+    return decorate
+
+
+@_jit()
+def _move(x, y, steps, step_size, x_low, x_high, y_low, y_high):
+    for i in prange(len(x)):
+        # min(max()) is what np.clip computes, so positions match the NumPy path bit for bit.
+        x[i] = min(max(x[i] + step_size * steps[i, 0], x_low), x_high)
+        y[i] = min(max(y[i] + step_size * steps[i, 1], y_low), y_high)
+
+
+@_jit()
+def _advanceCounters(infected, immunity, infectedCounter, immunityCounter, immunity_duration):
+    for i in prange(len(infected)):
+        if infected[i]:
+            infectedCounter[i] -= 1
+            if infectedCounter[i] <= 0:
+                infected[i] = False
+                immunity[i] = True
+                immunityCounter[i] = immunity_duration
+        if immunity[i]:
+            immunityCounter[i] -= 1
+            if immunityCounter[i] <= 0:
+                immunity[i] = False
+
+
+@_jit()
+def _cellPairs(x, y, groups, thresholds, cell_size, x_low, y_low, num_columns, num_rows):
+    n = len(x)
+    group_cells = num_columns * num_rows
+    num_cells = len(thresholds) * group_cells
+    cell = np.empty(n, dtype=np.int64)
+    for i in prange(n):
+        column = int((x[i] - x_low) // cell_size)
+        row = int((y[i] - y_low) // cell_size)
+        cell[i] = groups[i] * group_cells + column * num_rows + row
+
+    # Counting sort of agents by cell.
+    starts = np.zeros(num_cells + 1, dtype=np.int64)
+    for i in range(n):
+        starts[cell[i] + 1] += 1
+    for c in range(num_cells):
+        starts[c + 1] += starts[c]
+    fill = starts[:-1].copy()
+    members = np.empty(n, dtype=np.int64)
+    for i in range(n):
+        members[fill[cell[i]]] = i
+        fill[cell[i]] += 1
+
+    # Two passes over the 3x3 neighborhoods in the agent's group: count each agent's partners j > i, then write them.
+    found = np.zeros(n + 1, dtype=np.int64)
+    for i in prange(n):
+        base = groups[i] * group_cells
+        column, row = (cell[i] - base) // num_rows, (cell[i] - base) % num_rows
+        threshold = thresholds[groups[i]]
+        count = 0
+        for neighbor_column in range(max(column - 1, 0), min(column + 2, num_columns)):
+            for neighbor_row in range(max(row - 1, 0), min(row + 2, num_rows)):
+                c = base + neighbor_column * num_rows + neighbor_row
+                for k in range(starts[c], starts[c + 1]):
+                    j = members[k]
+                    # Same strict test as kdtreePairs: sqrt(dx**2 + dy**2) < threshold.
+                    if j > i and np.sqrt((x[j] - x[i]) ** 2 + (y[j] - y[i]) ** 2) < threshold:
+                        count += 1
+        found[i + 1] = count
+    for i in range(n):
+        found[i + 1] += found[i]
+
+    pairs = np.empty((found[n], 2), dtype=np.intp)
+    for i in prange(n):
+        base = groups[i] * group_cells
+        column, row = (cell[i] - base) // num_rows, (cell[i] - base) % num_rows
+        threshold = thresholds[groups[i]]
+        position = found[i]
+        for neighbor_column in range(max(column - 1, 0), min(column + 2, num_columns)):
+            for neighbor_row in range(max(row - 1, 0), min(row + 2, num_rows)):
+                c = base + neighbor_column * num_rows + neighbor_row
+                for k in range(starts[c], starts[c + 1]):
+                    j = members[k]
+                    if j > i and np.sqrt((x[j] - x[i]) ** 2 + (y[j] - y[i]) ** 2) < threshold:
+                        pairs[position, 0] = i
+                        pairs[position, 1] = j
+                        position += 1
+    return pairs
+
+
+@_jit(parallel=False)
+def _sequentialInfect(offsets, neighbors, infected, immunity, vaccinated, resistance, rolls,
+                      newly_infected, infectors):
+    used = 0
+    count = 0
+    for i in range(len(offsets) - 1):
+        for k in range(offsets[i], offsets[i + 1]):
+            j = neighbors[k]
+            # The rollInfect loop: every infected neighbor of a susceptible agent costs one roll.
+            if infected[j] and not immunity[i] and not infected[i] and not vaccinated[i]:
+                roll = rolls[used]
+                used += 1
+                if roll > resistance[i]:
+                    infected[i] = True
+                    newly_infected[count] = i
+                    infectors[count] = j
+                    count += 1
+    return used, count
+
+
+def move(x, y, steps, step_size, xBounds, yBounds):
+    _move(x, y, steps, float(step_size), float(xBounds[0]), float(xBounds[1]),
+          float(yBounds[0]), float(yBounds[1]))
+
+
+def advanceCounters(population, immunity_duration):
+    _advanceCounters(population.infected, population.immunity, population.infectedCounter,
+                     population.immunityCounter, int(immunity_duration))
+
+
+def cellPairs(positions, proximity_threshold, groups=None):
+    """
+    contactPairs through a parallel cell list; the same sorted (i < j) pairs as the
+    KD-tree. Returns None when the agents are too spread out for a dense cell grid.
+
+    With groups (a group index per agent) only agents of the same group pair up,
+    and proximity_threshold holds one threshold per group.
+    """
+    x = np.ascontiguousarray(positions[:, 0])
+    y = np.ascontiguousarray(positions[:, 1])
+    if groups is None:
+        groups = np.zeros(len(x), dtype=np.int64)
+        proximity_threshold = [proximity_threshold]
+    thresholds = np.asarray(proximity_threshold, dtype=np.float64)
+    cell_size = thresholds.max(initial=0)
+    if len(x) == 0 or cell_size <= 0:
+        return np.empty((0, 2), dtype=np.intp)
+    x_low, y_low = x.min(), y.min()
+    num_columns = int((x.max() - x_low) // cell_size) + 1
+    num_rows = int((y.max() - y_low) // cell_size) + 1
+    if len(thresholds) * num_columns * num_rows > MAX_CELLS_PER_AGENT * len(x) + 4096 * len(thresholds):
+        return None
+    pairs = _cellPairs(x, y, np.asarray(groups, dtype=np.int64), thresholds, cell_size, x_low, y_low,
+                       num_columns, num_rows)
+    # Partners come out in cell order; one sort over all pairs puts them in (i, j) order like contactPairs.
+    return pairs[np.lexsort((pairs[:, 1], pairs[:, 0]))]
+
+
+def sequentialInfect(offsets, neighbors, population, rolls):
+    """
+    Runs the in-order rollInfect loop, marking infections in population.infected as it goes.
+
+    Returns:
+    tuple: (rolls used, indices of the newly infected in infection order, the neighbor that infected each)
+    """
+    newly_infected = np.empty(len(population), dtype=np.intp)
+    infectors = np.empty(len(population), dtype=np.intp)
+    used, count = _sequentialInfect(offsets, neighbors, population.infected, population.immunity,
+                                    population.vaccinated, population.resistance, rolls,
+                                    newly_infected, infectors)
+    return used, newly_infected[:count], infectors[:count]
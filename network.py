@@ -0,0 +1,153 @@
+import numpy as np
+from scipy import sparse
+
+from population import randomSource
+
+DEFAULT_HOUSEHOLD_SIZE = 3
+DEFAULT_WORKPLACE_SIZE = 10
+DEFAULT_EMPLOYMENT_RATE = 0.6
+DEFAULT_HOUSEHOLD_WEIGHT = 1.0
+DEFAULT_WORKPLACE_WEIGHT = 0.5
+
+
+def groupMembership(members, mean_size, num_agents, rng=None):
+    """
+    Splits members into groups of 1 + Poisson(mean_size - 1) agents in random order.
+
+    Returns:
+    ndarray: Group id per agent, -1 for agents outside every group.
+    """
+    rng = randomSource(rng)
+    members = rng.permutation(np.asarray(members, dtype=np.intp))
+    # Enough sizes to cover everyone with high probability, topped up if not.
+    sizes = 1 + rng.poisson(max(mean_size - 1, 0), len(members) // max(int(mean_size), 1) + 16)
+    while sizes.sum() < len(members):
+        sizes = np.concatenate((sizes, 1 + rng.poisson(max(mean_size - 1, 0), len(sizes))))
+    sizes = sizes[:np.searchsorted(np.cumsum(sizes), len(members)) + 1]
+    groups = np.full(num_agents, -1, dtype=np.intp)
+    groups[members] = np.repeat(np.arange(len(sizes)), sizes)[:len(members)]
+    return groups
+
+
+def cliqueEdges(groups):
+    """
+    Directed (row, column) edges joining every pair of agents that share a group.
+
+    Built without a Python loop over groups: each agent gets one edge to every
+    other member of its group, read from the agents sorted by group.
+    """
+    members = np.flatnonzero(groups >= 0)
+    members = members[np.argsort(groups[members], kind="stable")]
+    _, starts, sizes = np.unique(groups[members], return_index=True, return_counts=True)
+    member_sizes = np.repeat(sizes, sizes)
+    member_starts = np.repeat(starts, sizes)
+    local = np.arange(len(members)) - member_starts
+    degrees = member_sizes - 1
+    rows = np.repeat(members, degrees)
+    # k-th neighbor of an agent: the k-th other member, skipping the agent itself.
+    edge_offsets = np.repeat(np.cumsum(degrees) - degrees, degrees)
+    k = np.arange(len(rows)) - edge_offsets
+    k += k >= np.repeat(local, degrees)
+    columns = members[np.repeat(member_starts, degrees) + k]
+    return rows, columns
+
+
+class ContactNetwork:
+    """
+    Fixed contact network stored as one CSR sparse adjacency matrix, built once
+    and reused every step. Entry (i, j) is the weight of the contact between i
+    and j, counted in spatial contacts: 1.0 is as infectious as one agent within
+    the proximity threshold. Agents who share several groups have the weights
+    summed.
+
+    Each step costs one sparse matrix-vector product, pressure(), so the cost
+    follows the number of edges. Indices are int32 and weights float32 while
+    they fit, 8 bytes per directed edge.
+
+    params holds the households() arguments, seed included, of a network that
+    can be rebuilt exactly from them; None otherwise.
+    """
+
+    def __init__(self, adjacency, params=None):
+        adjacency = sparse.csr_matrix(adjacency, dtype=np.float32)
+        adjacency.sum_duplicates()
+        self.adjacency = adjacency
+        self.params = params
+
+    @classmethod
+    def fromGroups(cls, num_agents, layers):
+        """
+        Parameters:
+        num_agents (int): Population size.
+        layers (list): (groups, weight) pairs; groups holds a group id per agent, -1 for none.
+        """
+        rows, columns, weights = [], [], []
+        for groups, weight in layers:
+            layer_rows, layer_columns = cliqueEdges(np.asarray(groups))
+            rows.append(layer_rows)
+            columns.append(layer_columns)
+            weights.append(np.full(len(layer_rows), weight, dtype=np.float32))
+        index_type = np.int32 if num_agents < np.iinfo(np.int32).max else np.int64
+        rows = np.concatenate(rows).astype(index_type) if rows else np.empty(0, dtype=index_type)
+        columns = np.concatenate(columns).astype(index_type) if columns else np.empty(0, dtype=index_type)
+        weights = np.concatenate(weights) if weights else np.empty(0, dtype=np.float32)
+        adjacency = sparse.coo_matrix((weights, (rows, columns)), shape=(num_agents, num_agents))
+        return cls(adjacency.tocsr())
+
+    @classmethod
+    def households(cls, num_agents, household_size=DEFAULT_HOUSEHOLD_SIZE, workplace_size=DEFAULT_WORKPLACE_SIZE,
+                   employment_rate=DEFAULT_EMPLOYMENT_RATE, household_weight=DEFAULT_HOUSEHOLD_WEIGHT,
+                   workplace_weight=DEFAULT_WORKPLACE_WEIGHT, rng=None, seed=None):
+        """
+        Every agent lives in a household, and a random employment_rate share of them
+        also works in a workplace. Group sizes are 1 + Poisson(size - 1).
+
+        With seed the network draws from its own np.random.default_rng(seed) instead
+        of rng and keeps its arguments in params, so it can be rebuilt exactly.
+        """
+        params = None
+        if seed is not None:
+            rng = np.random.default_rng(seed)
+            params = {"household_size": float(household_size), "workplace_size": float(workplace_size),
+                      "employment_rate": float(employment_rate), "household_weight": float(household_weight),
+                      "workplace_weight": float(workplace_weight), "seed": int(seed)}
+        rng = randomSource(rng)
+        households = groupMembership(np.arange(num_agents), household_size, num_agents, rng)
+        workers = np.flatnonzero(rng.random(num_agents) < employment_rate)
+        workplaces = groupMembership(workers, workplace_size, num_agents, rng)
+        network = cls.fromGroups(num_agents, [(households, household_weight), (workplaces, workplace_weight)])
+        network.params = params
+        return network
+
+    def __len__(self):
+        return self.adjacency.shape[0]
+
+    @property
+    def num_edges(self):
+        """Undirected edges; the matrix stores both directions."""
+        return self.adjacency.nnz // 2
+
+    @property
+    def nbytes(self):
+        adjacency = self.adjacency
+        return adjacency.data.nbytes + adjacency.indices.nbytes + adjacency.indptr.nbytes
+
+    def pressure(self, infected):
+        """Summed contact weight of every agent's infected neighbors, one sparse mat-vec."""
+        return self.adjacency @ np.asarray(infected, dtype=np.float32)
+
+    def firstInfectedNeighbor(self, indices, infected):
+        """For each agent in indices, its first infected neighbor, or -1."""
+        indptr, neighbors = self.adjacency.indptr, self.adjacency.indices
+        indices = np.asarray(indices, dtype=np.intp)
+        starts = indptr[indices]
+        lengths = indptr[indices + 1] - starts
+        ends = np.cumsum(lengths)
+        entries = np.repeat(starts - (ends - lengths), lengths) + np.arange(ends[-1] if len(ends) else 0)
+        candidates = neighbors[entries]
+        hit = infected[candidates]
+        owners = np.repeat(np.arange(len(indices)), lengths)[hit]
+        found, first = np.unique(owners, return_index=True)
+        result = np.full(len(indices), -1, dtype=np.intp)
+        result[found] = candidates[hit][first]
+        return result
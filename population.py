@@ -0,0 +1,337 @@
+import numpy as np
+
+import kernels
+
+INFECTED_DURATION = 50
+IMMUNITY_DURATION = 50
+VACCINE_IMMUNITY_DURATION = 100
+RESISTANCE_GROWTH = 1.5
+
+
+class Population:
+    """
+    Structure-of-arrays population: every agent attribute lives in one
+    contiguous NumPy array so a whole step is a handful of array operations
+    instead of one Python method call per agent.
+
+    Indexing or iterating yields AgentView objects, so code written against
+    the Agent API keeps working on a Population.
+
+    With scheduled=True recoveries and immunity expiries come from a
+    TransitionSchedule instead of counting every agent down each step.
+    Writing infected, immunity or a counter through an AgentView detaches
+    the schedule: the counters rule until the next step or count, which
+    rebuilds the schedule from them.
+
+    onInfection, when set, is called as onInfection(indices, infectors) for
+    every infection started; infectors is None where the source is unknown.
+    """
+
+    def __init__(self, x, y, infected, resistance, immunity=None, immunityCounter=None,
+                 infectedCounter=None, vaccinated=None, scheduled=False):
+        self.x = np.asarray(x, dtype=np.float64).copy()
+        self.y = np.asarray(y, dtype=np.float64).copy()
+        n = len(self.x)
+        self.infected = _filled(infected, n, bool)
+        self.resistance = _filled(resistance, n, np.float64)
+        self.immunity = _filled(immunity, n, bool)
+        self.immunityCounter = _filled(immunityCounter, n, np.int64)
+        self.infectedCounter = _filled(infectedCounter, n, np.int64)
+        self.vaccinated = _filled(vaccinated, n, bool)
+        self.schedule = TransitionSchedule(self) if scheduled else None
+        self.onInfection = None
+        self._detached = False
+
+    @classmethod
+    def random(cls, num_agents, bounds, resistance, num_initial_infected=0, rng=None, scheduled=False):
+        # One (n, 2) draw consumes the stream in the same x, y, x, y...
+        # order as building Agent objects one at a time.
+        xy = randomSource(rng).uniform(bounds[0], bounds[1], (num_agents, 2))
+        population = cls(xy[:, 0], xy[:, 1], False, resistance, scheduled=scheduled)
+        population.seed_infections(num_initial_infected)
+        return population
+
+    def seed_infections(self, count):
+        self.start_infections(np.arange(min(count, len(self))))
+
+    def start_infections(self, indices, infectors=None):
+        """Marks agents infected for INFECTED_DURATION steps, infected by infectors if known."""
+        if self.onInfection is not None:
+            self.onInfection(indices, infectors)
+        schedule = self._attached_schedule()
+        if schedule is not None:
+            schedule.infecting(indices)
+        self.infected[indices] = True
+        self.infectedCounter[indices] = INFECTED_DURATION
+
+    def __len__(self):
+        return len(self.x)
+
+    def __getitem__(self, index):
+        n = len(self)
+        if index < 0:
+            index += n
+        if not 0 <= index < n:
+            raise IndexError("agent index out of range")
+        return AgentView(self, index)
+
+    def __iter__(self):
+        for i in range(len(self)):
+            yield AgentView(self, i)
+
+    def positions(self):
+        return np.column_stack((self.x, self.y))
+
+    def movement(self, stepSize, xBounds, yBounds, rng=None):
+        steps = randomSource(rng).uniform(-1, 1, (len(self), 2))
+        if kernels.ENABLED:
+            kernels.move(self.x, self.y, steps, stepSize, xBounds, yBounds)
+        else:
+            self.x += stepSize * steps[:, 0]
+            self.y += stepSize * steps[:, 1]
+
+            np.clip(self.x, xBounds[0], xBounds[1], out=self.x)
+            np.clip(self.y, yBounds[0], yBounds[1], out=self.y)
+
+        self.advance_counters()
+
+    def advance_counters(self):
+        schedule = self._attached_schedule()
+        if schedule is not None:
+            schedule.advance()
+            return
+        if kernels.ENABLED:
+            kernels.advanceCounters(self, IMMUNITY_DURATION)
+            return
+        infected = self.infected
+        self.infectedCounter[infected] -= 1
+        recovered = infected & (self.infectedCounter <= 0)
+        self.infected[recovered] = False
+        self.immunity[recovered] = True
+        self.immunityCounter[recovered] = IMMUNITY_DURATION
+
+        immune = self.immunity
+        self.immunityCounter[immune] -= 1
+        expired = immune & (self.immunityCounter <= 0)
+        self.immunity[expired] = False
+
+    def infect(self, index, rng=None, infector=None):
+        if not self.infected[index] and not self.immunity[index] and not self.vaccinated[index]:
+            infectRoll = randomSource(rng).uniform()
+            if infectRoll > self.resistance[index]:
+                self.start_infections(index, infector)
+                self.resistance[index] *= RESISTANCE_GROWTH
+
+    def vaccinate(self, indices):
+        """Immunizes the agents that are not infected and marks them vaccinated, which rules out infection."""
+        indices = self.immunize(indices)
+        self.vaccinated[indices] = True
+
+    def immunize(self, indices, duration=VACCINE_IMMUNITY_DURATION):
+        """
+        Makes the agents that are not infected immune for duration steps, after
+        which they can be infected again. Returns the indices immunized.
+        """
+        indices = np.asarray(indices, dtype=np.intp)
+        indices = indices[~self.infected[indices]]
+        schedule = self._attached_schedule()
+        if schedule is not None:
+            schedule.immunizing(indices, duration)
+        self.immunity[indices] = True
+        self.immunityCounter[indices] = duration
+        return indices
+
+    def sync_counters(self, indices=slice(None)):
+        """Brings infectedCounter and immunityCounter up to date; a scheduled Population only stores due steps."""
+        if self.schedule is not None and not self._detached:
+            self.schedule.sync_counters(indices)
+
+    def detach_schedule(self):
+        """
+        Called before infected, immunity or a counter is written directly, as
+        AgentView does: the counters are synced and stay authoritative until
+        the schedule is next needed and rebuilt from them.
+        """
+        if self.schedule is not None and not self._detached:
+            self.schedule.sync_counters()
+            self._detached = True
+
+    def _attached_schedule(self):
+        if self._detached:
+            self._detached = False
+            # Only counting down copes with agents both infected and immune; such a population drops its schedule.
+            self.schedule = None if np.any(self.infected & self.immunity) else TransitionSchedule(self)
+        return self.schedule
+
+    def counts(self):
+        schedule = self._attached_schedule()
+        if schedule is not None:
+            return schedule.counts()
+        infected = int(np.count_nonzero(self.infected))
+        immune = int(np.count_nonzero(self.immunity))
+        healthy = int(np.count_nonzero(~(self.infected | self.immunity)))
+        return infected, immune, healthy
+
+
+class TransitionSchedule:
+    """
+    Calendar queue of a Population's pending recoveries and immunity expiries,
+    with one bucket of agent indices per due step. advance() only touches the
+    agents due at that step, and the compartment counts are updated as those
+    transitions happen instead of rescanning the whole population.
+
+    Produces the same transitions, on the same steps, as counting
+    infectedCounter and immunityCounter down every step. Infection and
+    immunity must change through Population methods so the queue sees them,
+    or after Population.detach_schedule().
+    """
+
+    def __init__(self, population):
+        if np.any(population.infected & population.immunity):
+            raise ValueError("A scheduled population cannot have agents both infected and immune")
+        self.population = population
+        self.clock = 0
+        self.recover_at = np.zeros(len(population), dtype=np.int64)
+        self.expire_at = np.zeros(len(population), dtype=np.int64)
+        self.num_infected = 0
+        self.num_immune = 0
+        self._recoveries = {}
+        self._expiries = {}
+        infected = np.flatnonzero(population.infected)
+        immune = np.flatnonzero(population.immunity)
+        self._schedule(self._recoveries, self.recover_at, infected, population.infectedCounter[infected])
+        self._schedule(self._expiries, self.expire_at, immune, population.immunityCounter[immune])
+        self.num_infected = len(infected)
+        self.num_immune = len(immune)
+
+    def _schedule(self, buckets, due_at, indices, durations, earliest=1):
+        # A counter of d runs out on the d-th step from now, or the next step if d <= 0.
+        due = self.clock + np.maximum(durations, earliest)
+        due_at[indices] = due
+        if len(indices) == 0:
+            return
+        if np.all(due == due[0]):
+            buckets.setdefault(int(due[0]), []).append(indices)
+            return
+        for step in np.unique(due):
+            buckets.setdefault(int(step), []).append(indices[due == step])
+
+    def _due(self, buckets, due_at, active, step):
+        # Rescheduled agents leave stale entries behind; only those still due at this step count.
+        chunks = buckets.pop(step, None)
+        if chunks is None:
+            return np.empty(0, dtype=np.intp)
+        indices = np.unique(np.concatenate(chunks))
+        return indices[active[indices] & (due_at[indices] == step)]
+
+    def infecting(self, indices):
+        """Called before agents become infected."""
+        indices = np.atleast_1d(np.asarray(indices, dtype=np.intp))
+        self.num_infected += int(np.count_nonzero(~self.population.infected[indices]))
+        self._schedule(self._recoveries, self.recover_at, indices,
+                       np.full(len(indices), INFECTED_DURATION))
+
+    def immunizing(self, indices, duration):
+        """Called before agents become immune for duration steps."""
+        indices = np.atleast_1d(np.asarray(indices, dtype=np.intp))
+        self.num_immune += int(np.count_nonzero(~self.population.immunity[indices]))
+        self._schedule(self._expiries, self.expire_at, indices, np.full(len(indices), duration))
+
+    def advance(self):
+        population = self.population
+        self.clock += 1
+        recovered = self._due(self._recoveries, self.recover_at, population.infected, self.clock)
+        population.infected[recovered] = False
+        population.immunity[recovered] = True
+        self.num_infected -= len(recovered)
+        self.num_immune += len(recovered)
+        # Immunity starts counting down on the step it is gained, so it can run out on that same step.
+        self._schedule(self._expiries, self.expire_at, recovered,
+                       np.full(len(recovered), IMMUNITY_DURATION - 1), earliest=0)
+        expired = self._due(self._expiries, self.expire_at, population.immunity, self.clock)
+        population.immunity[expired] = False
+        self.num_immune -= len(expired)
+
+    def sync_counters(self, indices=slice(None)):
+        population = self.population
+        population.infectedCounter[indices] = np.where(population.infected[indices],
+                                                       self.recover_at[indices] - self.clock, 0)
+        population.immunityCounter[indices] = np.where(population.immunity[indices],
+                                                       self.expire_at[indices] - self.clock, 0)
+
+    def counts(self):
+        return self.num_infected, self.num_immune, len(self.population) - self.num_infected - self.num_immune
+
+
+class AgentView:
+    """Single-agent view onto a Population with the same attributes and methods as Agent."""
+
+    __slots__ = ("_population", "_index")
+
+    def __init__(self, population, index):
+        self._population = population
+        self._index = index
+
+    def movement(self, stepSize, xBounds, yBounds, rng=None):
+        rng = randomSource(rng)
+        self.x += stepSize * rng.uniform(-1, 1)
+        self.y += stepSize * rng.uniform(-1, 1)
+
+        self.x = np.clip(self.x, xBounds[0], xBounds[1])
+        self.y = np.clip(self.y, yBounds[0], yBounds[1])
+
+        if self.infected:
+            self.infectedCounter -= 1
+            if self.infectedCounter <= 0:
+                self.infected = False
+                self.immunity = True
+                self.immunityCounter = IMMUNITY_DURATION
+
+        if self.immunity:
+            self.immunityCounter -= 1
+            if self.immunityCounter <= 0:
+                self.immunity = False
+
+    def infect(self, rng=None):
+        self._population.infect(self._index, rng)
+
+    def vaccinate(self):
+        self._population.vaccinate([self._index])
+
+
+def _view_property(name, cast, scheduled=False, counter=False):
+    # scheduled attributes are the ones a TransitionSchedule keeps track of. Of those only the
+    # counters are stored lazily; infected and immunity are always current.
+    def getter(self):
+        if counter:
+            self._population.sync_counters(self._index)
+        return cast(getattr(self._population, name)[self._index])
+
+    def setter(self, value):
+        if scheduled:
+            self._population.detach_schedule()
+        getattr(self._population, name)[self._index] = value
+
+    return property(getter, setter)
+
+
+for _name, _cast, _scheduled, _counter in (("x", float, False, False), ("y", float, False, False),
+                                           ("infected", bool, True, False), ("resistance", float, False, False),
+                                           ("immunity", bool, True, False), ("immunityCounter", int, True, True),
+                                           ("infectedCounter", int, True, True),
+                                           ("vaccinated", bool, False, False)):
+    setattr(AgentView, _name, _view_property(_name, _cast, _scheduled, _counter))
+
+
+def randomSource(rng):
+    # None keeps the legacy behavior of drawing from the global np.random state.
+    return np.random if rng is None else rng
+
+
+def _filled(values, n, dtype):
+    if values is None:
+        return np.zeros(n, dtype=dtype)
+    array = np.asarray(values, dtype=dtype)
+    if array.ndim == 0:
+        return np.full(n, array, dtype=dtype)
+    return array.copy()
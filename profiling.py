@@ -0,0 +1,172 @@
+import cProfile
+import json
+import time
+import tracemalloc
+from contextlib import nullcontext
+
+PHASES = ("vaccination", "movement", "contacts", "infection", "statistics", "export", "frames", "checkpoint",
+          "render")
+
+
+class NullProfiler:
+    """Stand-in used when profiling is off; every hook is a no-op."""
+
+    enabled = False
+    _context = nullcontext()
+
+    def phase(self, name):
+        return self._context
+
+    def endStep(self, num_agents=0, num_infected=0, num_contacts=0):
+        pass
+
+    def start(self):
+        pass
+
+    def stop(self):
+        pass
+
+
+NULL_PROFILER = NullProfiler()
+
+
+def _tracedBlocks():
+    # One trace per live traced block; the snapshot is dropped at once so it never counts itself.
+    return len(tracemalloc.take_snapshot().traces)
+
+
+class _Phase:
+    __slots__ = ("profiler", "name", "started", "memory", "blocks")
+
+    def __init__(self, profiler, name):
+        self.profiler = profiler
+        self.name = name
+
+    def __enter__(self):
+        if self.profiler.trace_allocations:
+            self.blocks = _tracedBlocks()
+            tracemalloc.reset_peak()
+            self.memory = tracemalloc.get_traced_memory()[0]
+        self.started = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc_info):
+        elapsed = time.perf_counter() - self.started
+        net_bytes = peak_bytes = net_blocks = 0
+        if self.profiler.trace_allocations:
+            current, peak = tracemalloc.get_traced_memory()
+            net_bytes = current - self.memory
+            peak_bytes = peak - self.memory
+            net_blocks = _tracedBlocks() - self.blocks
+        self.profiler._add(self.name, elapsed, net_bytes, peak_bytes, net_blocks)
+
+
+class StepProfiler:
+    """
+    Records wall time per phase of the step loop, per step and cumulatively.
+
+    Parameters:
+    trace_allocations (bool): Also record net and peak bytes allocated in each
+        phase, and the net number of blocks still allocated from it, with
+        tracemalloc. Costly, only use it when hunting memory growth: counting
+        blocks snapshots every live traced allocation at each phase boundary.
+    cprofile_path (str): Run cProfile between start() and stop() and dump its stats here.
+    """
+
+    enabled = True
+
+    def __init__(self, trace_allocations=False, cprofile_path=None):
+        self.trace_allocations = trace_allocations
+        self.cprofile_path = cprofile_path
+        self._cprofile = None
+        self._started_tracing = False
+        self.totals = {}
+        self.steps = []
+        self._current = {}
+
+    def start(self):
+        if self.trace_allocations and not tracemalloc.is_tracing():
+            tracemalloc.start()
+            self._started_tracing = True
+        if self.cprofile_path:
+            self._cprofile = cProfile.Profile()
+            self._cprofile.enable()
+
+    def stop(self):
+        if self._cprofile is not None:
+            self._cprofile.disable()
+            self._cprofile.dump_stats(self.cprofile_path)
+            self._cprofile = None
+        if self._started_tracing:
+            tracemalloc.stop()
+            self._started_tracing = False
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.stop()
+
+    def phase(self, name):
+        return _Phase(self, name)
+
+    def _add(self, name, elapsed, net_bytes, peak_bytes, net_blocks):
+        total = self.totals.setdefault(name, {"seconds": 0.0, "calls": 0, "max_seconds": 0.0,
+                                              "net_bytes": 0, "peak_bytes": 0, "net_blocks": 0})
+        total["seconds"] += elapsed
+        total["calls"] += 1
+        total["max_seconds"] = max(total["max_seconds"], elapsed)
+        total["net_bytes"] += net_bytes
+        total["peak_bytes"] = max(total["peak_bytes"], peak_bytes)
+        total["net_blocks"] += net_blocks
+        step = self._current.setdefault(name, [0.0, 0, 0])
+        step[0] += elapsed
+        step[1] += net_bytes
+        step[2] += net_blocks
+
+    def endStep(self, num_agents=0, num_infected=0, num_contacts=0):
+        self.steps.append({
+            "seconds": {name: values[0] for name, values in self._current.items()},
+            "net_bytes": {name: values[1] for name, values in self._current.items()},
+            "net_blocks": {name: values[2] for name, values in self._current.items()},
+            "agents": num_agents,
+            "infected": num_infected,
+            "contacts": num_contacts,
+        })
+        self._current = {}
+
+    def report(self):
+        """
+        Returns:
+        dict: "phases" maps each phase to its cumulative seconds, calls, mean and max
+            seconds per call and allocated bytes and blocks; "steps" holds per-step
+            seconds, bytes, blocks and agent/infected/contact counts.
+        """
+        phases = {}
+        for name, total in self.totals.items():
+            phases[name] = dict(total, mean_seconds=total["seconds"] / total["calls"])
+        return {
+            "num_steps": len(self.steps),
+            "total_seconds": sum(total["seconds"] for total in self.totals.values()),
+            "trace_allocations": self.trace_allocations,
+            "phases": phases,
+            "steps": self.steps,
+        }
+
+    def summary(self):
+        report = self.report()
+        lines = [f"{report['num_steps']} steps, {report['total_seconds']:.3f} s in instrumented phases"]
+        for name, phase in sorted(report["phases"].items(), key=lambda item: -item[1]["seconds"]):
+            share = phase["seconds"] / report["total_seconds"] if report["total_seconds"] else 0.0
+            line = (f"  {name:<12} {phase['seconds']:9.3f} s {share:6.1%}  "
+                    f"mean {phase['mean_seconds'] * 1000:8.3f} ms  max {phase['max_seconds'] * 1000:8.3f} ms")
+            if self.trace_allocations:
+                line += (f"  net {phase['net_bytes'] / 1024:10.1f} KiB  peak {phase['peak_bytes'] / 1024:10.1f} KiB"
+                         f"  net blocks {phase['net_blocks']:8d}")
+            lines.append(line)
+        return "\n".join(lines)
+
+    def save(self, path):
+        with open(path, "w") as report_file:
+            json.dump(self.report(), report_file, indent=2)
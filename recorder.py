@@ -0,0 +1,130 @@
+import json
+import os
+
+import numpy as np
+
+# Bits of the packed per-agent state code.
+STATE_INFECTED = 1
+STATE_IMMUNE = 2
+STATE_VACCINATED = 4
+
+POSITIONS_FILE = "positions.npy"
+STATES_FILE = "states.npy"
+META_FILE = "meta.json"
+
+
+def packStates(infected, immunity, vaccinated=None):
+    states = np.asarray(infected, dtype=np.uint8) * STATE_INFECTED
+    states |= np.asarray(immunity, dtype=np.uint8) * STATE_IMMUNE
+    if vaccinated is not None:
+        states |= np.asarray(vaccinated, dtype=np.uint8) * STATE_VACCINATED
+    return states
+
+
+def unpackFrame(positions, states):
+    """Returns the (positions, infected, immunity) tuple the dashboard figures take."""
+    states = np.asarray(states)
+    return np.array(positions), (states & STATE_INFECTED) != 0, (states & STATE_IMMUNE) != 0
+
+
+class FrameRecorder:
+    """
+    Streams per-step agent state into preallocated memory-mapped .npy files.
+
+    Positions are stored as float32 (frames, N, 2) and states as a packed uint8
+    (frames, N) code, so a recording costs 9 bytes per agent per frame on disk
+    and nothing in RAM beyond the pages being written.
+
+    Parameters:
+    directory (str): Where positions.npy, states.npy and meta.json are written.
+    num_agents (int): Population size.
+    timesteps (int): Number of steps the run will take.
+    stride (int): Record every stride-th step, starting with step 0.
+    """
+
+    def __init__(self, directory, num_agents, timesteps, stride=1):
+        if stride < 1:
+            raise ValueError("stride must be at least 1")
+        self.directory = directory
+        self.stride = stride
+        self.timesteps = timesteps
+        num_frames = -(-timesteps // stride)
+        os.makedirs(directory, exist_ok=True)
+        self.positions = np.lib.format.open_memmap(
+            os.path.join(directory, POSITIONS_FILE), mode="w+", dtype=np.float32, shape=(num_frames, num_agents, 2)
+        )
+        self.states = np.lib.format.open_memmap(
+            os.path.join(directory, STATES_FILE), mode="w+", dtype=np.uint8, shape=(num_frames, num_agents)
+        )
+        self.count = 0
+
+    def record(self, step, positions, infected, immunity, vaccinated=None):
+        """Writes the state after the given step if it falls on the stride."""
+        if step % self.stride:
+            return
+        frame = step // self.stride
+        self.positions[frame] = positions
+        self.states[frame] = packStates(infected, immunity, vaccinated)
+        self.count = frame + 1
+
+    def close(self):
+        self.positions.flush()
+        self.states.flush()
+        meta = {"count": self.count, "stride": self.stride, "timesteps": self.timesteps}
+        with open(os.path.join(self.directory, META_FILE), "w") as meta_file:
+            json.dump(meta, meta_file)
+
+    def __len__(self):
+        return self.count
+
+    def __getitem__(self, index):
+        """Reads back a recorded frame, so a run in progress can be displayed while it records."""
+        if index < 0:
+            index += self.count
+        if not 0 <= index < self.count:
+            raise IndexError("frame index out of range")
+        return unpackFrame(self.positions[index], self.states[index])
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+class FrameReader:
+    """
+    Read-only view of a FrameRecorder directory. Frames are sliced from the
+    memory maps on access, so reading one frame never loads the others.
+
+    reader[i] returns (positions, infected, immunity) like the frames the
+    dashboard has always used; reader.steps[i] is the timestep of frame i.
+    """
+
+    def __init__(self, directory):
+        self.directory = directory
+        with open(os.path.join(directory, META_FILE)) as meta_file:
+            meta = json.load(meta_file)
+        self.stride = meta["stride"]
+        self.timesteps = meta["timesteps"]
+        count = meta["count"]
+        self.positions = np.load(os.path.join(directory, POSITIONS_FILE), mmap_mode="r")[:count]
+        self.states = np.load(os.path.join(directory, STATES_FILE), mmap_mode="r")[:count]
+        self.steps = np.arange(count) * self.stride
+
+    @staticmethod
+    def exists(directory):
+        return os.path.exists(os.path.join(directory, META_FILE))
+
+    def __len__(self):
+        return len(self.states)
+
+    def __getitem__(self, index):
+        return unpackFrame(self.positions[index], self.states[index])
+
+    def __iter__(self):
+        for index in range(len(self)):
+            yield self[index]
+
+    def vaccinated(self, index):
+        return (np.asarray(self.states[index]) & STATE_VACCINATED) != 0
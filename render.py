@@ -0,0 +1,167 @@
+import os
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+
+import imageio.v2 as imageio
+import numpy as np
+from PIL import Image, ImageDraw
+
+import kernels
+from recorder import FrameReader
+
+# Palette indices; colors match the dashboard figures.
+BACKGROUND, HEALTHY, IMMUNE, INFECTED, TEXT = range(5)
+PALETTE = np.array([
+    (255, 255, 255),
+    (0, 128, 0),
+    (0, 0, 255),
+    (255, 0, 0),
+    (0, 0, 0),
+], dtype=np.uint8)
+TITLE_HEIGHT = 24
+VIDEO_EXTENSIONS = (".mp4", ".mkv", ".avi", ".mov")
+
+
+class FrameRasterizer:
+    """
+    Draws agents as filled dots straight into one reused palette-index buffer.
+
+    GIF frames are written from the index buffer as-is, which skips Pillow's
+    per-frame color quantization; rgb() expands it into a reused RGB buffer for
+    video writers.
+
+    Parameters:
+    size (int): Width and height of the plot area in pixels.
+    bounds (tuple): Simulation bounds mapped onto the plot area.
+    point_radius (int): Dot radius in pixels.
+    title (bool): Adds an "Infected = N" strip above the plot like the old matplotlib frames.
+    """
+
+    def __init__(self, size=600, bounds=(0, 500), point_radius=3, title=True):
+        self.size = size
+        self.bounds = bounds
+        self.title = title
+        self.top = TITLE_HEIGHT if title else 0
+        self.buffer = np.empty((size + self.top, size), dtype=np.uint8)
+        self.rgb_buffer = np.empty((size + self.top, size, 3), dtype=np.uint8)
+        span = np.arange(-point_radius, point_radius + 1)
+        dy, dx = np.meshgrid(span, span, indexing="ij")
+        inside = dx ** 2 + dy ** 2 <= point_radius ** 2
+        self.offsets_x = dx[inside]
+        self.offsets_y = dy[inside]
+
+    def _pixels(self, positions):
+        low, high = self.bounds
+        scale = (self.size - 1) / (high - low)
+        columns = np.rint((positions[:, 0] - low) * scale).astype(np.intp)
+        # Image rows grow downwards, simulation y grows upwards.
+        rows = (self.size - 1) - np.rint((positions[:, 1] - low) * scale).astype(np.intp)
+        return rows, columns
+
+    def _draw(self, rows, columns, color):
+        if len(rows) == 0:
+            return
+        rows = np.clip(rows[:, None] + self.offsets_y, 0, self.size - 1) + self.top
+        columns = np.clip(columns[:, None] + self.offsets_x, 0, self.size - 1)
+        self.buffer[rows, columns] = color
+
+    def render(self, positions, infected, immunity):
+        """Returns the reused index buffer holding the rendered frame; copy it to keep it."""
+        positions = np.asarray(positions)
+        infected = np.asarray(infected, dtype=bool)
+        immunity = np.asarray(immunity, dtype=bool)
+        self.buffer[...] = BACKGROUND
+        rows, columns = self._pixels(positions)
+        healthy = ~(infected | immunity)
+        immune = immunity & ~infected
+        # Infected last so they stay visible in crowds.
+        self._draw(rows[healthy], columns[healthy], HEALTHY)
+        self._draw(rows[immune], columns[immune], IMMUNE)
+        self._draw(rows[infected], columns[infected], INFECTED)
+        if self.title:
+            header = Image.fromarray(self.buffer[:self.top], mode="L")
+            draw = ImageDraw.Draw(header)
+            # Antialiased glyph edges would land on other palette indices.
+            draw.fontmode = "1"
+            draw.text((self.size // 2 - 40, 6), f"Infected = {int(infected.sum())}", fill=TEXT)
+            self.buffer[:self.top] = np.asarray(header)
+        return self.buffer
+
+    def rgb(self, indices=None):
+        """Expands an index frame (the last rendered one by default) into the reused RGB buffer."""
+        indices = self.buffer if indices is None else indices
+        return np.take(PALETTE, indices, axis=0, out=self.rgb_buffer)
+
+
+def _renderChunk(job):
+    directory, indices, options = job
+    reader = FrameReader(directory)
+    rasterizer = FrameRasterizer(**options)
+    return np.stack([rasterizer.render(*reader[index]).copy() for index in indices])
+
+
+class _AnimationWriter:
+    """imageio writer taking index frames: paletted GIF frames, or RGB for video formats."""
+
+    def __init__(self, name, duration, rasterizer):
+        self.rasterizer = rasterizer
+        self.video = os.path.splitext(name)[1].lower() in VIDEO_EXTENSIONS
+        if self.video:
+            # Video writers need the imageio-ffmpeg plugin and take a frame rate instead of a duration.
+            self.writer = imageio.get_writer(name, fps=1000 / duration, macro_block_size=1)
+        else:
+            self.writer = imageio.get_writer(
+                name, mode="I", duration=duration, loop=0, pilmode="P", palette=PALETTE.tobytes()
+            )
+
+    def append(self, indices):
+        if self.video:
+            self.writer.append_data(self.rasterizer.rgb(indices))
+        else:
+            # Pillow assembles the GIF on close and keeps a reference to every frame,
+            # so hand it a copy of the reused buffer (one byte per pixel).
+            self.writer.append_data(indices.copy())
+
+    def appendAll(self, frames):
+        for indices in frames:
+            self.append(indices)
+
+    def close(self):
+        self.writer.close()
+
+
+def renderAnimation(frames, name, duration=100, workers=1, chunk_size=16, **options):
+    """
+    Renders frames to a GIF or video, appending each frame to the writer as soon as it is drawn.
+
+    Parameters:
+    frames: A FrameReader, or any sequence of (positions, infected, immunity) frames.
+    name (str): Output path; .gif, or .mp4/.mkv/.avi/.mov with imageio-ffmpeg installed.
+    duration (int): Milliseconds per frame.
+    workers (int): Processes rasterizing in parallel. Only used for FrameReader input,
+        where workers open the recording themselves instead of receiving pickled frames.
+    chunk_size (int): Frames per parallel task.
+    options: FrameRasterizer arguments (size, bounds, point_radius, title).
+    """
+    rasterizer = FrameRasterizer(**options)
+    writer = _AnimationWriter(name, duration, rasterizer)
+    try:
+        if workers > 1 and isinstance(frames, FrameReader):
+            jobs = [
+                (frames.directory, range(start, min(start + chunk_size, len(frames))), options)
+                for start in range(0, len(frames), chunk_size)
+            ]
+            with ProcessPoolExecutor(max_workers=workers, mp_context=kernels.poolContext()) as pool:
+                # Keep only a few chunks in flight so rendered frames never pile up in memory.
+                pending = deque()
+                for job in jobs:
+                    pending.append(pool.submit(_renderChunk, job))
+                    if len(pending) >= 2 * workers:
+                        writer.appendAll(pending.popleft().result())
+                while pending:
+                    writer.appendAll(pending.popleft().result())
+        else:
+            for frame in frames:
+                writer.append(rasterizer.render(*frame))
+    finally:
+        writer.close()
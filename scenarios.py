@@ -0,0 +1,233 @@
+import argparse
+
+import numpy as np
+
+import kernels
+from contacts import contactPairs
+from infection import INFECTION_MODES
+from population import Population, randomSource
+from simulation import rollInfect
+
+# Parameters that may differ between the scenarios of a batch, with their defaults.
+# vaccination_interval > 0 repeats the vaccination every that many steps after vaccination_step;
+# vaccinate_healthy draws the vaccinated fraction from healthy agents instead of everyone;
+# without vaccine_permanent vaccination only grants timed immunity (Population.immunize), after
+# which agents can be infected again.
+SCENARIO_PARAMETERS = {
+    "resistance": (0.3, float),
+    "proximity": (10, float),
+    "step_size": (5, float),
+    "vaccination_rate": (0.2, float),
+    "vaccination_step": (100, int),
+    "vaccination_interval": (0, int),
+    "vaccinate_healthy": (False, bool),
+    "vaccine_permanent": (True, bool),
+}
+
+
+def normalizeScenario(scenario):
+    unknown = set(scenario) - set(SCENARIO_PARAMETERS)
+    if unknown:
+        raise ValueError(f"Unknown scenario parameters: {sorted(unknown)}")
+    return {name: cast(scenario.get(name, default)) for name, (default, cast) in SCENARIO_PARAMETERS.items()}
+
+
+class ScenarioBatch:
+    """
+    S independent scenarios of num_agents agents each, advanced together.
+
+    All scenarios live in one Population of S * num_agents agents, scenario s
+    owning the block [s * num_agents, (s + 1) * num_agents), so movement,
+    transitions and infection are single array operations across the batch.
+    With numba installed contacts come from one cell list with a grid per
+    scenario, otherwise from a KD-tree per scenario.
+
+    A batch of one scenario draws the same random numbers, in the same order,
+    as simulateRun and gives the same statistics.
+    """
+
+    def __init__(self, scenarios, num_agents=500, num_initial_infected=10, bounds=(0, 500),
+                 infection_mode="contact", rng=None):
+        if infection_mode not in INFECTION_MODES:
+            raise ValueError(f"Unknown infection mode: {infection_mode}")
+        self.scenarios = [normalizeScenario(scenario) for scenario in scenarios]
+        self.num_scenarios = len(self.scenarios)
+        self.num_agents = num_agents
+        self.bounds = bounds
+        self.infection_mode = infection_mode
+        self.rng = rng
+        self.step_size = self._perAgent("step_size")
+        self.proximity = np.array([scenario["proximity"] for scenario in self.scenarios])
+        self._scenario = np.repeat(np.arange(self.num_scenarios), num_agents)
+        self._permanent = np.repeat([scenario["vaccine_permanent"] for scenario in self.scenarios], num_agents)
+
+        xy = randomSource(rng).uniform(bounds[0], bounds[1], (self.num_scenarios * num_agents, 2))
+        self.population = Population(xy[:, 0], xy[:, 1], False, self._perAgent("resistance"))
+        first = np.arange(min(num_initial_infected, num_agents))
+        self.population.start_infections((self.offsets()[:, None] + first).ravel())
+        self.vaccinate([True] * self.num_scenarios)
+
+    def _perAgent(self, name):
+        return np.repeat([scenario[name] for scenario in self.scenarios], self.num_agents).astype(np.float64)
+
+    def offsets(self):
+        return np.arange(self.num_scenarios) * self.num_agents
+
+    def view(self, name):
+        """An (S, num_agents) view of a Population array."""
+        return getattr(self.population, name).reshape(self.num_scenarios, self.num_agents)
+
+    def vaccinationDue(self, step):
+        due = []
+        for scenario in self.scenarios:
+            start, interval = scenario["vaccination_step"], scenario["vaccination_interval"]
+            due.append(step == start or interval > 0 and step > start and (step - start) % interval == 0)
+        return due
+
+    def vaccinationMask(self, due):
+        """(S, num_agents) mask of the agents each due scenario's policy vaccinates."""
+        rng = randomSource(self.rng)
+        mask = np.zeros((self.num_scenarios, self.num_agents), dtype=bool)
+        infected, immunity = self.view("infected"), self.view("immunity")
+        for s, scenario in enumerate(self.scenarios):
+            if not due[s]:
+                continue
+            rate = scenario["vaccination_rate"]
+            if scenario["vaccinate_healthy"]:
+                healthy = np.flatnonzero(~(infected[s] | immunity[s]))
+                chosen = rng.choice(healthy, int(len(healthy) * rate), replace=False)
+            else:
+                # The same draw as vaccinate_agents.
+                chosen = rng.choice(self.num_agents, int(self.num_agents * rate), replace=False)
+            mask[s, chosen] = True
+        return mask
+
+    def vaccinate(self, due):
+        if any(due):
+            chosen = self.vaccinationMask(due).ravel()
+            self.population.vaccinate(np.flatnonzero(chosen & self._permanent))
+            self.population.immunize(np.flatnonzero(chosen & ~self._permanent))
+
+    def move(self):
+        population = self.population
+        steps = randomSource(self.rng).uniform(-1, 1, (len(population), 2))
+        population.x += self.step_size * steps[:, 0]
+        population.y += self.step_size * steps[:, 1]
+        np.clip(population.x, self.bounds[0], self.bounds[1], out=population.x)
+        np.clip(population.y, self.bounds[0], self.bounds[1], out=population.y)
+        population.advance_counters()
+
+    def findContacts(self):
+        """Sorted (i < j) pairs closer than their scenario's proximity, never across scenarios."""
+        positions = self.population.positions()
+        if kernels.ENABLED:
+            # One pass over the whole batch; a grid per scenario keeps scenarios apart.
+            pairs = kernels.cellPairs(positions, self.proximity, self._scenario)
+            if pairs is not None:
+                return pairs
+        blocks = [
+            contactPairs(positions[offset:offset + self.num_agents], threshold, "kdtree") + offset
+            for offset, threshold in zip(self.offsets(), self.proximity)
+        ]
+        return np.concatenate(blocks) if blocks else np.empty((0, 2), dtype=np.intp)
+
+    def step(self, step):
+        self.vaccinate(self.vaccinationDue(step))
+        self.move()
+        rollInfect(self.population, mode=self.infection_mode, rng=self.rng, pairs=self.findContacts())
+
+    def counts(self):
+        """(S, 3) trackCounts of every scenario: infected, immune, healthy."""
+        infected, immunity = self.view("infected"), self.view("immunity")
+        return np.column_stack((
+            np.count_nonzero(infected, axis=1),
+            np.count_nonzero(immunity, axis=1),
+            np.count_nonzero(~(infected | immunity), axis=1),
+        ))
+
+    def recordFrame(self, recorder, step, scenario=0):
+        recorder.record(step, np.column_stack((self.view("x")[scenario], self.view("y")[scenario])),
+                        self.view("infected")[scenario], self.view("immunity")[scenario],
+                        self.view("vaccinated")[scenario])
+
+
+def simulateScenarios(scenarios, num_agents=500, num_initial_infected=10, bounds=(0, 500), timesteps=500,
+                      infection_mode="contact", rng=None, recorder=None, record_scenario=0, onStep=None):
+    """
+    Runs every scenario for timesteps steps in one batched loop.
+
+    Parameters:
+    scenarios (list): Dicts of SCENARIO_PARAMETERS; missing entries take the defaults.
+    recorder (FrameRecorder): Records the frames of scenario record_scenario when given.
+    onStep (callable): onStep(step, statistics) after every step, as in simulateRun.
+
+    Returns:
+    dict: "statistics" is an (S, timesteps, 3) int array of trackCounts per scenario,
+        "scenarios" the scenarios with defaults filled in.
+    """
+    batch = ScenarioBatch(scenarios, num_agents, num_initial_infected, bounds, infection_mode, rng)
+    statistics = np.empty((batch.num_scenarios, timesteps, 3), dtype=np.int64)
+    for i in range(timesteps):
+        batch.step(i)
+        statistics[:, i] = batch.counts()
+        if recorder is not None:
+            batch.recordFrame(recorder, i, record_scenario)
+        if onStep is not None:
+            onStep(i, statistics[:, :i + 1])
+    return {"statistics": statistics, "scenarios": batch.scenarios}
+
+
+def plotScenarios(result, path, labels=None):
+    """Saves the infected curve of every scenario in one figure."""
+    import matplotlib.pyplot as plt
+
+    labels = labels or [f"scenario {s}" for s in range(len(result["statistics"]))]
+    figure, axes = plt.subplots(figsize=(8, 5))
+    for label, counts in zip(labels, result["statistics"]):
+        axes.plot(counts[:, 0], label=label)
+    axes.set_xlabel("Step")
+    axes.set_ylabel("Infected")
+    axes.legend()
+    figure.savefig(path)
+    plt.close(figure)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Compare simulation scenarios in one batched run.")
+    parser.add_argument("--vaccination-rate", type=float, nargs="+", default=[0.0, 0.2, 0.5],
+                        help="One scenario per rate")
+    parser.add_argument("--vaccination-step", type=int, default=100)
+    parser.add_argument("--vaccination-interval", type=int, default=0)
+    parser.add_argument("--vaccinate-healthy", action="store_true")
+    parser.add_argument("--temporary-vaccine", action="store_true",
+                        help="Vaccination only grants timed immunity, after which agents can be infected again")
+    parser.add_argument("--resistance", type=float, default=0.3)
+    parser.add_argument("--proximity", type=float, default=10)
+    parser.add_argument("--step-size", type=float, default=5)
+    parser.add_argument("--num-agents", type=int, default=500)
+    parser.add_argument("--initial-infected", type=int, default=10)
+    parser.add_argument("--timesteps", type=int, default=500)
+    parser.add_argument("--infection-mode", choices=INFECTION_MODES, default="contact")
+    parser.add_argument("--seed", type=int, default=None)
+    parser.add_argument("--output", default="scenario_comparison.png")
+    args = parser.parse_args(argv)
+
+    scenarios = [
+        dict(vaccination_rate=rate, vaccination_step=args.vaccination_step,
+             vaccination_interval=args.vaccination_interval, vaccinate_healthy=args.vaccinate_healthy,
+             vaccine_permanent=not args.temporary_vaccine,
+             resistance=args.resistance, proximity=args.proximity, step_size=args.step_size)
+        for rate in args.vaccination_rate
+    ]
+    rng = None if args.seed is None else np.random.default_rng(args.seed)
+    result = simulateScenarios(scenarios, args.num_agents, args.initial_infected, timesteps=args.timesteps,
+                               infection_mode=args.infection_mode, rng=rng)
+    labels = [f"vaccination rate {rate:g}" for rate in args.vaccination_rate]
+    for label, counts in zip(labels, result["statistics"]):
+        print(f"{label}: peak infected {counts[:, 0].max()} at step {counts[:, 0].argmax()}")
+    plotScenarios(result, args.output, labels)
+    print(f"Comparison saved as {args.output}")
+
+
+if __name__ == "__main__":
+    main()
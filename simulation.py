@@ -1,9 +1,28 @@
 import numpy as np
-import matplotlib.pyplot as plt
-import imageio.v2 as imageio
 from scipy.spatial import distance_matrix
-import os
 import argparse
+import shutil
+import tempfile
+
+import kernels
+from checkpoint import Checkpoint, loadCheckpoint, saveCheckpoint
+from contacts import CONTACT_BACKENDS, contactPairs, neighborLists
+from export import EXPORT_FORMATS, RunExporter, plot_statistics
+from infection import INFECTION_MODES, activePairs, batchInfect, networkInfect, sequentialInfect
+from network import DEFAULT_EMPLOYMENT_RATE, DEFAULT_WORKPLACE_SIZE, ContactNetwork
+from population import Population, randomSource
+from profiling import NULL_PROFILER, StepProfiler
+from recorder import FrameReader, FrameRecorder
+from render import renderAnimation
+
+# run_simulation's run parameters and their defaults; a resumed run takes the checkpoint's values instead.
+RUN_DEFAULTS = {
+    "num_agents": 500, "num_initial_infected": 10, "resistance": 0.3, "step_size": 5, "bounds": (0, 500),
+    "timesteps": 500, "proximity": 10, "vaccination_rate": 0.2, "vaccination_step": 100,
+    "contact_backend": "kdtree", "infection_mode": None,
+}
+# Parameters the agents in a checkpoint were created with; resuming cannot change them.
+POPULATION_PARAMS = ("num_agents", "num_initial_infected", "resistance")
 
 class Agent:
     def __init__(self, x, y, infected, resistance, immunity=False, immunityCounter=0, infectedCounter=0, vaccinated=False):
@@ -16,9 +35,10 @@ class Agent:
         self.infectedCounter = infectedCounter
         self.vaccinated = vaccinated
 
-    def movement(self, stepSize, xBounds, yBounds):
-        self.x += stepSize * np.random.uniform(-1, 1)
-        self.y += stepSize * np.random.uniform(-1, 1)
+    def movement(self, stepSize, xBounds, yBounds, rng=None):
+        rng = randomSource(rng)
+        self.x += stepSize * rng.uniform(-1, 1)
+        self.y += stepSize * rng.uniform(-1, 1)
         
         self.x = np.clip(self.x, xBounds[0], xBounds[1])
         self.y = np.clip(self.y, yBounds[0], yBounds[1])
@@ -35,9 +55,9 @@ class Agent:
             if self.immunityCounter <= 0:
                 self.immunity = False
     
-    def infect(self):
+    def infect(self, rng=None):
         if not self.infected and not self.immunity and not self.vaccinated:
-            infectRoll = np.random.uniform()
+            infectRoll = randomSource(rng).uniform()
             if infectRoll > self.resistance:
                 self.infected = True
                 self.infectedCounter = 50
@@ -49,94 +69,479 @@ class Agent:
             self.vaccinated = True
             self.immunityCounter = 100  # Longer immunity for vaccinated agents
 
-def vaccinate_agents(agents, vaccination_rate=0.2):
+def vaccinate_agents(agents, vaccination_rate=0.2, rng=None):
     num_to_vaccinate = int(len(agents) * vaccination_rate)
-    selected_agents = np.random.choice(agents, num_to_vaccinate, replace=False)
+    if isinstance(agents, Population):
+        agents.vaccinate(randomSource(rng).choice(len(agents), num_to_vaccinate, replace=False))
+        return
+    selected_agents = randomSource(rng).choice(agents, num_to_vaccinate, replace=False)
     for agent in selected_agents:
         agent.vaccinate()
 
 def getPosition(agents):
+    if isinstance(agents, Population):
+        return agents.positions()
     positions = []
     for agent in agents:
         positions.append([agent.x, agent.y])
     return np.array(positions)
 
-def moveAgents(agents, stepSize, xBounds, yBounds):
+def moveAgents(agents, stepSize, xBounds, yBounds, rng=None):
+    if isinstance(agents, Population):
+        agents.movement(stepSize, xBounds, yBounds, rng)
+        return agents
     for agent in agents:
-        agent.movement(stepSize, xBounds, yBounds)
+        agent.movement(stepSize, xBounds, yBounds, rng)
     return agents
 
 def getInfected(agents):
+    if isinstance(agents, Population):
+        return agents.infected.copy()
     infected = []
     for agent in agents:
         infected.append(agent.infected)
     return infected
 
+def getImmunity(agents):
+    if isinstance(agents, Population):
+        return agents.immunity.copy()
+    return [agent.immunity for agent in agents]
+
+def getVaccinated(agents):
+    if isinstance(agents, Population):
+        return agents.vaccinated.copy()
+    return [agent.vaccinated for agent in agents]
+
+def recordFrame(recorder, step, agents):
+    if isinstance(agents, Population):
+        recorder.record(step, agents.positions(), agents.infected, agents.immunity, agents.vaccinated)
+    else:
+        recorder.record(step, getPosition(agents), getInfected(agents), getImmunity(agents), getVaccinated(agents))
+
 def getCloseAgents(distanceMatrix, agentNumber, proximity_threshold=10):
     sort = np.argsort(distanceMatrix[agentNumber])
     closeMask = distanceMatrix[agentNumber][sort] < proximity_threshold
     closeAgents = np.argsort(distanceMatrix[agentNumber])[closeMask][1:]
     return closeAgents
 
-def rollInfect(agents, proximity_threshold=10):
+def findContacts(agents, proximity_threshold=10, backend="kdtree", mode="sequential"):
+    """
+    Contact pairs for one infection step. Besides the contacts.CONTACT_BACKENDS,
+    backend "active" searches infected-susceptible pairs only (infection.activePairs);
+    it needs a Population and a batch mode, since the sequential loop lets agents
+    infected earlier in the step pass it on to any contact.
+    """
+    if backend == "active":
+        if mode == "sequential" or not isinstance(agents, Population):
+            raise ValueError("The active contact backend needs a Population and a batch infection mode")
+        return activePairs(agents, proximity_threshold)
+    return contactPairs(getPosition(agents), proximity_threshold, backend)
+
+def rollInfect(agents, proximity_threshold=10, backend="kdtree", mode="sequential", rng=None, pairs=None,
+               network=None):
+    if network is not None:
+        # Network contacts join the per-agent roll of the "agent" mode.
+        if mode != "agent" or not isinstance(agents, Population):
+            raise ValueError("Network transmission needs a Population and infection mode 'agent'")
+        if pairs is None:
+            pairs = findContacts(agents, proximity_threshold, backend, mode)
+        networkInfect(agents, network, pairs, rng)
+        return agents
+    if mode != "sequential":
+        if not isinstance(agents, Population):
+            raise ValueError(f"Infection mode {mode!r} needs a Population, use mode='sequential' for Agent lists")
+        if pairs is None:
+            pairs = findContacts(agents, proximity_threshold, backend, mode)
+        batchInfect(agents, pairs, mode, rng)
+        return agents
+    if isinstance(agents, Population) and kernels.ENABLED:
+        if pairs is None:
+            pairs = findContacts(agents, proximity_threshold, backend, mode)
+        sequentialInfect(agents, pairs, rng)
+        return agents
+    if isinstance(agents, Population):
+        # A Population also learns who passed the infection on.
+        infect = lambda i, j: agents.infect(i, rng, infector=j)
+    else:
+        infect = lambda i, j: agents[i].infect(rng)
     positions = getPosition(agents)
-    distanceMatrix = distance_matrix(positions, positions)
+    if backend == "dense" and pairs is None:
+        distanceMatrix = distance_matrix(positions, positions)
+        for i in range(len(agents)):
+            closeAgents = getCloseAgents(distanceMatrix, i, proximity_threshold)
+            for j in closeAgents:
+                if agents[j].infected and not agents[i].immunity:
+                    infect(i, j)
+        return agents
+    if pairs is None:
+        pairs = findContacts(agents, proximity_threshold, backend, mode)
+    offsets, neighbors = neighborLists(pairs, len(agents))
     for i in range(len(agents)):
-        closeAgents = getCloseAgents(distanceMatrix, i, proximity_threshold)
-        for j in closeAgents:
+        for j in neighbors[offsets[i]:offsets[i + 1]]:
             if agents[j].infected and not agents[i].immunity:
-                agents[i].infect()
+                infect(i, j)
     return agents
 
 def trackCounts(agents):
+    if isinstance(agents, Population):
+        return agents.counts()
     infected = sum(1 for agent in agents if agent.infected)
     immune = sum(1 for agent in agents if agent.immunity)
     healthy = sum(1 for agent in agents if not agent.infected and not agent.immunity)
     return infected, immune, healthy
 
-def makeGif(frames, name, duration=100):
-    os.makedirs("frames", exist_ok=True)
-    images = []
-    for counter, frame in enumerate(frames):
-        plt.figure(figsize=(8, 8))
-        plt.scatter(frame[0], frame[1], c=frame[2], cmap="RdYlGn_r")
-        plt.title(f"Infected = {np.sum(frame[2])}")
-        plt.tick_params(left=False, right=False, labelleft=False, labelbottom=False, bottom=False)
-        frame_path = f"frames/{counter}.png"
-        plt.savefig(frame_path)
-        images.append(imageio.imread(frame_path))
-        plt.close()
-    imageio.mimsave(name, images, duration=duration)
+def makeGif(frames, name, duration=100, workers=1, bounds=(0, 500)):
+    if not isinstance(frames, FrameReader):
+        # Legacy [x, y, infected] frames carry no immunity.
+        frames = (
+            (np.column_stack((frame[0], frame[1])), frame[2], np.zeros(len(frame[0]), dtype=bool))
+            for frame in frames
+        )
+    renderAnimation(frames, name, duration=duration, workers=workers, bounds=bounds)
     print(f"Animation saved as {name}")
-    for file in os.listdir("frames"):
-        os.remove(os.path.join("frames", file))
-    os.rmdir("frames")
-
-def run_simulation(num_agents=500, num_initial_infected=10, resistance=0.3, 
-                  step_size=5, bounds=(0, 500), timesteps=500, 
-                  proximity=10, vaccination_rate=0.2, vaccination_step=100, 
-                  create_gif=True, plot_stats=True):
-    agents = [Agent(np.random.uniform(bounds[0], bounds[1]), np.random.uniform(bounds[0], bounds[1]), False, resistance) for _ in range(num_agents)]
+
+def createAgents(num_agents, num_initial_infected, resistance, bounds, engine="population", rng=None):
+    if engine == "population":
+        return Population.random(num_agents, bounds, resistance, num_initial_infected, rng, scheduled=True)
+    if engine != "agents":
+        raise ValueError(f"Unknown engine: {engine}")
+    rng = randomSource(rng)
+    agents = [Agent(rng.uniform(bounds[0], bounds[1]), rng.uniform(bounds[0], bounds[1]), False, resistance) for _ in range(num_agents)]
     for i in range(min(num_initial_infected, num_agents)):
         agents[i].infected = True
         agents[i].infectedCounter = 50
-    vaccinate_agents(agents, vaccination_rate)
-    frames = []
-    statistics = []
-    for i in range(timesteps):
+    return agents
+
+def stepAgents(agents, step_size, bounds, proximity, contact_backend="kdtree",
+               infection_mode="sequential", rng=None, profiler=NULL_PROFILER, network=None):
+    """
+    Moves agents and rolls infections for one timestep, timing each phase with profiler.
+    network (a ContactNetwork) adds household/workplace transmission to the spatial contacts.
+    """
+    with profiler.phase("movement"):
+        agents = moveAgents(agents, step_size, bounds, bounds, rng)
+    with profiler.phase("contacts"):
+        pairs = findContacts(agents, proximity, contact_backend, infection_mode)
+    with profiler.phase("infection"):
+        agents = rollInfect(agents, proximity, contact_backend, infection_mode, rng, pairs, network)
+    return agents, pairs
+
+def checkpointParams(num_agents, num_initial_infected, resistance, step_size, bounds, timesteps,
+                     proximity, vaccination_rate, vaccination_step, contact_backend, infection_mode, network=None):
+    """The run parameters saved with a checkpoint, as the defaults for resuming it."""
+    if network is not None and network.params is None:
+        raise ValueError("Checkpointed runs need a network that can be rebuilt, "
+                         "from ContactNetwork.households(..., seed=...)")
+    return {
+        "num_agents": int(num_agents), "num_initial_infected": int(num_initial_infected),
+        "resistance": float(resistance), "step_size": float(step_size),
+        "bounds": [float(bounds[0]), float(bounds[1])], "timesteps": int(timesteps),
+        "proximity": float(proximity), "vaccination_rate": float(vaccination_rate),
+        "vaccination_step": int(vaccination_step), "contact_backend": contact_backend,
+        "infection_mode": infection_mode, "network": None if network is None else network.params,
+    }
+
+def openCheckpoint(checkpoint):
+    return checkpoint if isinstance(checkpoint, Checkpoint) else loadCheckpoint(checkpoint)
+
+def resumeParams(checkpoint, overrides):
+    """The checkpoint's saved run parameters with overrides applied; overrides of POPULATION_PARAMS must match."""
+    params = dict(checkpoint.params)
+    for name in POPULATION_PARAMS:
+        if name in overrides and name in params and overrides[name] != params[name]:
+            raise ValueError(f"Cannot resume with {name}={overrides[name]!r}, "
+                             f"the checkpoint's agents were created with {params[name]!r}")
+    params.update(overrides)
+    return params
+
+def resumeAgents(checkpoint, timesteps):
+    """Returns the Population and random generator a run continues from (None for the global state)."""
+    if checkpoint.step > timesteps:
+        raise ValueError(f"The checkpoint is at step {checkpoint.step}, past the run's {timesteps} timesteps")
+    return checkpoint.population(scheduled=True), checkpoint.random()
+
+def networkSeed(seed):
+    """
+    A seed for the contact network of a run seeded with seed, apart from the run's
+    own stream so rebuilding the network on resume leaves that stream alone.
+    """
+    if seed is None:
+        return int(np.random.randint(2 ** 31))
+    return int(np.random.SeedSequence(seed).spawn(1)[0].generate_state(1)[0])
+
+def checkpointDue(step, timesteps, every):
+    # After every `every` completed steps, and always after the last one.
+    completed = step + 1
+    return completed == timesteps or bool(every) and completed % every == 0
+
+def endProfiledStep(profiler, agents, pairs):
+    if profiler.enabled:
+        profiler.endStep(len(agents), trackCounts(agents)[0], len(pairs))
+
+def simulateRun(num_agents=500, num_initial_infected=10, resistance=0.3,
+                step_size=5, bounds=(0, 500), timesteps=500,
+                proximity=10, vaccination_rate=0.2, vaccination_step=100,
+                contact_backend="kdtree", infection_mode="sequential", rng=None,
+                recorder=None, profiler=None, onStep=None,
+                checkpoint_path=None, checkpoint_every=0, resume=None, exporter=None, network=None,
+                engine="population"):
+    """
+    Runs the Population engine, streaming frames into recorder (a FrameRecorder) when given
+    and timing every phase of the step loop with profiler (a StepProfiler) when given.
+    engine="agents" runs a list of Agent objects instead, without checkpoints or infection events.
+    The recorder's frame 0 is the first step run here, which is checkpoint.step on resume.
+
+    onStep(step, statistics) is called after every step with the statistics recorded so far;
+    an exception raised from it stops the run.
+
+    exporter (a RunExporter) receives every step's counts, and the infection events when it
+    logs them; the caller closes it.
+
+    network (a ContactNetwork over the num_agents agents, or ContactNetwork.households
+    arguments with a seed) adds household/workplace transmission on top of the spatial
+    contacts; it needs infection_mode="agent".
+
+    With checkpoint_path a checkpoint is written there every checkpoint_every steps and after
+    the last one. resume (a Checkpoint or its path) continues a run from its checkpoint: the
+    agents, random state, statistics and, unless network is given, the contact network come
+    from the file, rng is not used, and the steps from checkpoint.step on are run with the
+    parameters given here.
+
+    Returns:
+    dict: "statistics" is a (timesteps, 3) int array of trackCounts (infected, immune, healthy)
+        and "agents" the Population (or Agent list) after the last step.
+    """
+    if engine != "population" and (checkpoint_path is not None or resume is not None
+                                   or exporter is not None and exporter.events):
+        raise ValueError("Checkpoints and infection events need the population engine")
+    profiler = NULL_PROFILER if profiler is None else profiler
+    result = {"statistics": np.empty((timesteps, 3), dtype=np.int64)}
+    start = 0
+    if resume is None:
+        agents = createAgents(num_agents, num_initial_infected, resistance, bounds, engine, rng)
+        vaccinate_agents(agents, vaccination_rate, rng)
+    else:
+        checkpoint = openCheckpoint(resume)
+        agents, rng = resumeAgents(checkpoint, timesteps)
+        start = checkpoint.step
+        result["statistics"][:start] = checkpoint.statistics
+        if network is None:
+            network = checkpoint.params.get("network")
+    if isinstance(network, dict):
+        network = ContactNetwork.households(len(agents), **network)
+    if checkpoint_path is not None:
+        params = checkpointParams(num_agents, num_initial_infected, resistance, step_size, bounds, timesteps,
+                                  proximity, vaccination_rate, vaccination_step, contact_backend, infection_mode,
+                                  network)
+    if exporter is not None:
+        exporter.attach(agents, start, result["statistics"][:start])
+    profiler.start()
+    for i in range(start, timesteps):
         if i == vaccination_step:
-            vaccinate_agents(agents, vaccination_rate)
-        agents = moveAgents(agents, step_size, bounds, bounds)
-        agents = rollInfect(agents, proximity)
-        positions = getPosition(agents)
-        infected = getInfected(agents)
+            with profiler.phase("vaccination"):
+                vaccinate_agents(agents, vaccination_rate, rng)
+        agents, pairs = stepAgents(agents, step_size, bounds, proximity, contact_backend,
+                                   infection_mode, rng, profiler, network)
+        with profiler.phase("statistics"):
+            result["statistics"][i] = trackCounts(agents)
+        if exporter is not None:
+            with profiler.phase("export"):
+                exporter.record(i, result["statistics"][i])
+        if recorder is not None:
+            with profiler.phase("frames"):
+                recordFrame(recorder, i - start, agents)
+        if checkpoint_path is not None and checkpointDue(i, timesteps, checkpoint_every):
+            with profiler.phase("checkpoint"):
+                saveCheckpoint(checkpoint_path, agents, i + 1, result["statistics"][:i + 1], rng, params)
+        endProfiledStep(profiler, agents, pairs)
+        if onStep is not None:
+            onStep(i, result["statistics"][:i + 1])
+    profiler.stop()
+    result["agents"] = agents
+    return result
+
+def resumeRun(checkpoint, **overrides):
+    """Continues a checkpointed simulateRun with its saved parameters, replaced by any overrides."""
+    checkpoint = openCheckpoint(checkpoint)
+    params = resumeParams(checkpoint, overrides)
+    return simulateRun(resume=checkpoint, **params)
+
+def forkRuns(checkpoint, scenarios):
+    """
+    Runs each scenario on from one shared checkpoint, e.g. a warm-up run stopped at
+    vaccination_step, so the common prefix is computed once.
+
+    Parameters:
+    checkpoint (Checkpoint or str): The shared starting point.
+    scenarios (iterable): Dicts of simulateRun parameters overriding the saved ones.
+
+    Returns:
+    list: One simulateRun result per scenario. Every scenario continues from the same agents
+    and random state, so scenarios differ only through their parameters.
+    """
+    checkpoint = openCheckpoint(checkpoint)
+    return [resumeRun(checkpoint, **scenario) for scenario in scenarios]
+
+def simulateCounts(**params):
+    """Runs simulateRun without frames and returns only its (timesteps, 3) statistics array."""
+    return simulateRun(**params)["statistics"]
+
+def run_simulation(num_agents=None, num_initial_infected=None, resistance=None,
+                  step_size=None, bounds=None, timesteps=None,
+                  proximity=None, vaccination_rate=None, vaccination_step=None,
+                  create_gif=True, plot_stats=True, engine="population",
+                  contact_backend=None, infection_mode=None, frame_stride=1, seed=None,
+                  profiler=None, checkpoint_path=None, checkpoint_every=0, resume=None,
+                  export_dir=None, export_format=None, export_events=False,
+                  household_size=None, workplace_size=DEFAULT_WORKPLACE_SIZE,
+                  employment_rate=DEFAULT_EMPLOYMENT_RATE, network_seed=None, frames_dir=None):
+    """
+    Runs a simulation, saving disease_simulation.gif and disease_stats.png.
+
+    Frames for the gif are recorded on disk, in a temporary directory under
+    frames_dir (the current directory, where the gif goes, by default) that is
+    removed once the gif is rendered or the run fails.
+
+    Run parameters (RUN_DEFAULTS) left as None take their default, or when
+    resuming the value saved in the checkpoint; the rest replace the saved ones.
+
+    household_size adds a household/workplace ContactNetwork built from
+    network_seed (derived from seed when not given). A checkpoint keeps the
+    network's parameters and seed, and resuming rebuilds the same network.
+
+    The steps themselves run in simulateRun, with the recorder, exporter and
+    network set up here.
+    """
+    given = dict(num_agents=num_agents, num_initial_infected=num_initial_infected, resistance=resistance,
+                 step_size=step_size, bounds=bounds, timesteps=timesteps, proximity=proximity,
+                 vaccination_rate=vaccination_rate, vaccination_step=vaccination_step,
+                 contact_backend=contact_backend, infection_mode=infection_mode)
+    given = {name: value for name, value in given.items() if value is not None}
+    if resume is not None:
+        checkpoint = openCheckpoint(resume)
+        params = dict(RUN_DEFAULTS, **resumeParams(checkpoint, given))
+    else:
+        params = dict(RUN_DEFAULTS, **given)
+    (num_agents, num_initial_infected, resistance, step_size, bounds, timesteps, proximity, vaccination_rate,
+     vaccination_step, contact_backend, infection_mode) = (params[name] for name in RUN_DEFAULTS)
+    # Without a seed the run draws from the global np.random state, as it always has.
+    rng = None if seed is None else np.random.default_rng(seed)
+    profiler = NULL_PROFILER if profiler is None else profiler
+    network_params = None
+    if household_size is not None:
+        network_params = {"household_size": float(household_size), "workplace_size": float(workplace_size),
+                          "employment_rate": float(employment_rate)}
+    if resume is not None:
+        # The network is rebuilt from the checkpoint; arguments describing it must agree.
+        saved = checkpoint.params.get("network")
+        if network_params is not None and network_seed is not None:
+            network_params["seed"] = network_seed
+        if network_params is not None and (saved is None or any(saved[name] != value
+                                                                for name, value in network_params.items())):
+            raise ValueError("Cannot resume with a different contact network than the checkpoint's")
+        network_params = saved
+    elif network_params is not None:
+        network_params["seed"] = networkSeed(seed) if network_seed is None else network_seed
+    if infection_mode is None:
+        # Network transmission only exists in the agent mode.
+        infection_mode = "agent" if network_params is not None else "sequential"
+    start = 0 if resume is None else checkpoint.step
+    recorder = exporter = recording_dir = None
+    try:
+        if create_gif:
+            # Not the system temp directory, which is often in RAM; recordings can take gigabytes.
+            recording_dir = tempfile.mkdtemp(prefix="disease_frames_", dir=frames_dir or ".")
+            recorder = FrameRecorder(recording_dir, num_agents, max(timesteps - start, 0), frame_stride)
+        if export_dir is not None:
+            exporter = RunExporter(export_dir, export_format, export_events)
+        try:
+            result = simulateRun(num_agents, num_initial_infected, resistance, step_size, bounds, timesteps,
+                                 proximity, vaccination_rate, vaccination_step, contact_backend, infection_mode, rng,
+                                 recorder, profiler, checkpoint_path=checkpoint_path,
+                                 checkpoint_every=checkpoint_every, resume=None if resume is None else checkpoint,
+                                 exporter=exporter, network=network_params, engine=engine)
+        finally:
+            # An interrupted run still leaves readable exports behind.
+            if exporter is not None:
+                exporter.close()
+            if recorder is not None:
+                recorder.close()
+        if exporter is not None:
+            print(f"Run exported to {export_dir}")
         if create_gif:
-            frames.append([positions[:, 0], positions[:, 1], infected])
-        if plot_stats:
-            infected_count, immune_count, healthy_count = trackCounts(agents)
-            statistics.append((infected_count, immune_count, healthy_count))
-    if create_gif:
-        makeGif(frames, "disease_simulation.gif")
+            with profiler.phase("render"):
+                makeGif(FrameReader(recording_dir), "disease_simulation.gif", bounds=bounds)
+    finally:
+        if recording_dir is not None:
+            shutil.rmtree(recording_dir, ignore_errors=True)
+    statistics = [tuple(row) for row in result["statistics"].tolist()]
     if plot_stats:
         plot_statistics(statistics, "disease_stats.png")
-    return agents, statistics
+    return result["agents"], statistics
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Run the agent-based disease simulation.")
+    # Run parameters default to None so run_simulation can tell them apart from a checkpoint's saved ones.
+    parser.add_argument("--num-agents", type=int, help="Default: 500")
+    parser.add_argument("--initial-infected", type=int, help="Default: 10")
+    parser.add_argument("--resistance", type=float, help="Default: 0.3")
+    parser.add_argument("--step-size", type=float, help="Default: 5")
+    parser.add_argument("--timesteps", type=int, help="Default: 500")
+    parser.add_argument("--proximity", type=float, help="Default: 10")
+    parser.add_argument("--vaccination-rate", type=float, help="Default: 0.2")
+    parser.add_argument("--vaccination-step", type=int, help="Default: 100")
+    parser.add_argument("--engine", choices=("population", "agents"), default="population")
+    parser.add_argument("--infection-mode", choices=INFECTION_MODES, default=None,
+                        help="Default: sequential, or agent with --household-size")
+    parser.add_argument("--contact-backend", choices=CONTACT_BACKENDS + ("active",),
+                        help="Default: kdtree. 'active' only searches infected-susceptible pairs (batch infection modes)")
+    parser.add_argument("--seed", type=int, default=None, help="Seed for a reproducible run")
+    parser.add_argument("--no-gif", action="store_true")
+    parser.add_argument("--frames-dir", help="Where frames are recorded before rendering the gif. "
+                                             "Default: the current directory")
+    parser.add_argument("--plot-stats", action="store_true")
+    parser.add_argument("--profile", action="store_true", help="Print time spent in each phase of the step loop")
+    parser.add_argument("--profile-output", help="Write the per-phase/per-step profile report as JSON")
+    parser.add_argument("--trace-allocations", action="store_true", help="Profile allocations with tracemalloc")
+    parser.add_argument("--cprofile", help="Dump cProfile stats for the run to this path")
+    parser.add_argument("--checkpoint", help="Write a resumable checkpoint of the run to this path")
+    parser.add_argument("--checkpoint-every", type=int, default=0,
+                        help="Steps between checkpoints; without it only the last step is saved")
+    parser.add_argument("--resume", help="Continue the run saved in this checkpoint, with its saved parameters "
+                                         "except those given on the command line")
+    parser.add_argument("--household-size", type=float, default=None,
+                        help="Add household and workplace contact networks with this mean household size")
+    parser.add_argument("--workplace-size", type=float, default=DEFAULT_WORKPLACE_SIZE)
+    parser.add_argument("--employment-rate", type=float, default=DEFAULT_EMPLOYMENT_RATE)
+    parser.add_argument("--network-seed", type=int, default=None,
+                        help="Seed for the contact network; derived from --seed by default")
+    parser.add_argument("--export", help="Stream per-step counts into this directory")
+    parser.add_argument("--export-format", choices=EXPORT_FORMATS, default=None,
+                        help="Default: parquet when pyarrow is installed, csv otherwise")
+    parser.add_argument("--export-events", action="store_true",
+                        help="Also export every infection as (step, infector, infectee)")
+    args = parser.parse_args(argv)
+
+    profiler = None
+    if args.profile or args.profile_output or args.trace_allocations or args.cprofile:
+        profiler = StepProfiler(trace_allocations=args.trace_allocations, cprofile_path=args.cprofile)
+
+    run_simulation(
+        num_agents=args.num_agents, num_initial_infected=args.initial_infected,
+        resistance=args.resistance, step_size=args.step_size, timesteps=args.timesteps,
+        proximity=args.proximity, vaccination_rate=args.vaccination_rate,
+        vaccination_step=args.vaccination_step, create_gif=not args.no_gif,
+        plot_stats=args.plot_stats, engine=args.engine, contact_backend=args.contact_backend,
+        infection_mode=args.infection_mode, seed=args.seed, profiler=profiler,
+        checkpoint_path=args.checkpoint, checkpoint_every=args.checkpoint_every, resume=args.resume,
+        export_dir=args.export, export_format=args.export_format, export_events=args.export_events,
+        household_size=args.household_size, workplace_size=args.workplace_size,
+        employment_rate=args.employment_rate, network_seed=args.network_seed, frames_dir=args.frames_dir,
+    )
+    if profiler is not None:
+        print(profiler.summary())
+        if args.profile_output:
+            profiler.save(args.profile_output)
+
+if __name__ == "__main__":
+    main()
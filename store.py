@@ -0,0 +1,135 @@
+import json
+import sqlite3
+import threading
+import time
+import uuid
+from collections import OrderedDict
+
+DEFAULT_MAX_SESSIONS = 1000
+DEFAULT_TTL = 6 * 60 * 60
+
+
+def newSessionId():
+    return uuid.uuid4().hex
+
+
+class MemorySessionStore:
+    """
+    Session-keyed store of small JSON-able dicts, held in this process.
+
+    Sessions unused for ttl seconds expire, and the least recently used ones are
+    dropped once there are more than max_sessions.
+    """
+
+    def __init__(self, max_sessions=DEFAULT_MAX_SESSIONS, ttl=DEFAULT_TTL):
+        self.max_sessions = max_sessions
+        self.ttl = ttl
+        self._sessions = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, session_id):
+        with self._lock:
+            entry = self._sessions.get(session_id)
+            if entry is None:
+                return None
+            updated, data = entry
+            now = time.time()
+            if now - updated > self.ttl:
+                del self._sessions[session_id]
+                return None
+            # Reads keep a session alive, as in the SQLite backend.
+            self._sessions[session_id] = (now, data)
+            self._sessions.move_to_end(session_id)
+            return json.loads(data)
+
+    def set(self, session_id, data):
+        # Stored serialized so callers never share mutable state, same as the SQLite backend.
+        encoded = json.dumps(data)
+        with self._lock:
+            self._sessions[session_id] = (time.time(), encoded)
+            self._sessions.move_to_end(session_id)
+            self._evict()
+
+    def delete(self, session_id):
+        with self._lock:
+            self._sessions.pop(session_id, None)
+
+    def _evict(self):
+        cutoff = time.time() - self.ttl
+        while self._sessions:
+            session_id, (updated, _) = next(iter(self._sessions.items()))
+            if updated >= cutoff and len(self._sessions) <= self.max_sessions:
+                break
+            del self._sessions[session_id]
+
+    def __len__(self):
+        return len(self._sessions)
+
+
+class SQLiteSessionStore:
+    """
+    Session store in an SQLite file, shared by every process that opens the same path,
+    e.g. several gunicorn workers. Same TTL and size bound as MemorySessionStore.
+    """
+
+    def __init__(self, path, max_sessions=DEFAULT_MAX_SESSIONS, ttl=DEFAULT_TTL):
+        self.path = path
+        self.max_sessions = max_sessions
+        self.ttl = ttl
+        self._local = threading.local()
+        with self._connection() as connection:
+            connection.execute("PRAGMA journal_mode=WAL")
+            connection.execute(
+                "CREATE TABLE IF NOT EXISTS sessions (id TEXT PRIMARY KEY, data TEXT NOT NULL, updated REAL NOT NULL)"
+            )
+            connection.execute("CREATE INDEX IF NOT EXISTS sessions_updated ON sessions (updated)")
+
+    def _connection(self):
+        # sqlite3 connections cannot be shared between threads, keep one per thread.
+        connection = getattr(self._local, "connection", None)
+        if connection is None:
+            connection = sqlite3.connect(self.path, timeout=30)
+            self._local.connection = connection
+        return connection
+
+    def get(self, session_id):
+        now = time.time()
+        with self._connection() as connection:
+            row = connection.execute(
+                "SELECT data, updated FROM sessions WHERE id = ?", (session_id,)
+            ).fetchone()
+            if row is None:
+                return None
+            if now - row[1] > self.ttl:
+                connection.execute("DELETE FROM sessions WHERE id = ?", (session_id,))
+                return None
+            connection.execute("UPDATE sessions SET updated = ? WHERE id = ?", (now, session_id))
+        return json.loads(row[0])
+
+    def set(self, session_id, data):
+        now = time.time()
+        with self._connection() as connection:
+            connection.execute(
+                "INSERT OR REPLACE INTO sessions (id, data, updated) VALUES (?, ?, ?)",
+                (session_id, json.dumps(data), now),
+            )
+            connection.execute("DELETE FROM sessions WHERE updated < ?", (now - self.ttl,))
+            connection.execute(
+                "DELETE FROM sessions WHERE id IN "
+                "(SELECT id FROM sessions ORDER BY updated DESC LIMIT -1 OFFSET ?)",
+                (self.max_sessions,),
+            )
+
+    def delete(self, session_id):
+        with self._connection() as connection:
+            connection.execute("DELETE FROM sessions WHERE id = ?", (session_id,))
+
+    def __len__(self):
+        return self._connection().execute("SELECT COUNT(*) FROM sessions").fetchone()[0]
+
+
+def openSessionStore(path=None, **options):
+    """An SQLiteSessionStore at path, or a MemorySessionStore when path is empty."""
+    if path:
+        return SQLiteSessionStore(path, **options)
+    return MemorySessionStore(**options)
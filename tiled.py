@@ -0,0 +1,339 @@
+import argparse
+import multiprocessing
+import os
+import time
+from multiprocessing import shared_memory
+
+import numpy as np
+
+from contacts import bipartitePairs
+from population import (IMMUNITY_DURATION, INFECTED_DURATION, RESISTANCE_GROWTH, Population,
+                        randomSource)
+from simulation import recordFrame, vaccinate_agents
+
+# Arrays kept in shared memory: (dtype, columns) with columns None for one value per agent.
+SHARED_ARRAYS = {
+    "xy": (np.float64, 2),
+    "moves": (np.float64, 2),
+    "infected": (bool, None),
+    "immunity": (bool, None),
+    "vaccinated": (bool, None),
+    "infectedCounter": (np.int64, None),
+    "immunityCounter": (np.int64, None),
+}
+
+
+class TileGrid:
+    """
+    Splits the square bounds plane into columns x rows equal tiles, numbered
+    column * rows + row. An agent belongs to the tile its position falls in and
+    is a halo agent of every neighboring tile it is within margin of.
+    """
+
+    def __init__(self, bounds, columns, rows, margin):
+        self.low, self.high = bounds
+        self.columns = columns
+        self.rows = rows
+        self.width = (self.high - self.low) / columns
+        self.height = (self.high - self.low) / rows
+        self.margin = margin
+        if min(self.width, self.height) < margin:
+            raise ValueError("Tiles must be at least proximity wide, use fewer workers or a larger plane")
+
+    @classmethod
+    def forWorkers(cls, bounds, workers, margin):
+        """The most nearly square grid with one tile per worker."""
+        columns = max(c for c in range(1, int(np.sqrt(workers)) + 1) if workers % c == 0)
+        return cls(bounds, workers // columns, columns, margin)
+
+    def __len__(self):
+        return self.columns * self.rows
+
+    def cells(self, xy):
+        columns = np.clip(((xy[:, 0] - self.low) // self.width).astype(np.intp), 0, self.columns - 1)
+        rows = np.clip(((xy[:, 1] - self.low) // self.height).astype(np.intp), 0, self.rows - 1)
+        return columns, rows
+
+    def tileOf(self, xy):
+        columns, rows = self.cells(xy)
+        return columns * self.rows + rows
+
+    def halo(self, xy):
+        """
+        Returns (index into xy, neighboring tile) for every agent within margin
+        of a neighboring tile; an agent near a corner is listed for up to three.
+        """
+        columns, rows = self.cells(xy)
+        x_offset = xy[:, 0] - (self.low + columns * self.width)
+        y_offset = xy[:, 1] - (self.low + rows * self.height)
+        everywhere = np.ones(len(xy), dtype=bool)
+        near_x = {-1: (x_offset <= self.margin) & (columns > 0), 0: everywhere,
+                  1: (self.width - x_offset <= self.margin) & (columns < self.columns - 1)}
+        near_y = {-1: (y_offset <= self.margin) & (rows > 0), 0: everywhere,
+                  1: (self.height - y_offset <= self.margin) & (rows < self.rows - 1)}
+        indices, tiles = [], []
+        for dx in (-1, 0, 1):
+            for dy in (-1, 0, 1):
+                if dx == dy == 0:
+                    continue
+                near = np.flatnonzero(near_x[dx] & near_y[dy])
+                indices.append(near)
+                tiles.append((columns[near] + dx) * self.rows + rows[near] + dy)
+        return np.concatenate(indices), np.concatenate(tiles)
+
+
+def _sharedShape(name, num_agents):
+    columns = SHARED_ARRAYS[name][1]
+    return (num_agents,) if columns is None else (num_agents, columns)
+
+
+def _attach(name, block_name, num_agents):
+    # Spawned workers share the coordinator's resource tracker, so attaching here
+    # does not hand the block's lifetime to this process; the coordinator unlinks it.
+    block = shared_memory.SharedMemory(name=block_name)
+    return block, np.ndarray(_sharedShape(name, num_agents), dtype=SHARED_ARRAYS[name][0], buffer=block.buf)
+
+
+def _tileWorker(connection, tile, grid, num_agents, block_names, proximity):
+    """
+    Owns the agents inside one tile. Each step it moves them and advances their
+    counters ("move"), reporting agents that crossed into another tile and
+    agents near its edges, then takes in arrivals and neighbors' halo agents
+    and reports the (target, infector) contacts of its susceptible agents ("infect").
+    """
+    blocks, shared = [], {}
+    for name, block_name in block_names.items():
+        block, shared[name] = _attach(name, block_name, num_agents)
+        blocks.append(block)
+    xy, moves = shared["xy"], shared["moves"]
+    infected, immunity, vaccinated = shared["infected"], shared["immunity"], shared["vaccinated"]
+    infectedCounter, immunityCounter = shared["infectedCounter"], shared["immunityCounter"]
+    owned = halo = np.empty(0, dtype=np.intp)
+
+    try:
+        while True:
+            command, payload = connection.recv()
+            if command == "stop":
+                break
+            if command == "own":
+                owned = payload
+                connection.send(None)
+            elif command == "move":
+                step_size, bounds = payload
+                # Same arithmetic as Population.movement and advance_counters, on this tile's agents.
+                positions = xy[owned] + step_size * moves[owned]
+                np.clip(positions, bounds[0], bounds[1], out=positions)
+                xy[owned] = positions
+
+                sick = owned[infected[owned]]
+                infectedCounter[sick] -= 1
+                recovered = sick[infectedCounter[sick] <= 0]
+                infected[recovered] = False
+                immunity[recovered] = True
+                immunityCounter[recovered] = IMMUNITY_DURATION
+                immune = owned[immunity[owned]]
+                immunityCounter[immune] -= 1
+                immunity[immune[immunityCounter[immune] <= 0]] = False
+
+                moved = owned
+                homes = grid.tileOf(positions)
+                near, halo_tiles = grid.halo(positions)
+                stay = homes == tile
+                owned = moved[stay]
+                # Agents that just left for a neighbor can still be in this tile's halo.
+                mine = halo_tiles == tile
+                halo = moved[near[mine]]
+                connection.send((moved[~stay], homes[~stay], moved[near[~mine]], halo_tiles[~mine]))
+            elif command == "infect":
+                arrivals, incoming_halo = payload
+                owned = np.concatenate((owned, arrivals))
+                nearby = np.concatenate((owned, halo, incoming_halo))
+                infectors = nearby[infected[nearby]]
+                susceptible = owned[~(infected[owned] | immunity[owned] | vaccinated[owned])]
+                pairs = bipartitePairs(xy, infectors, susceptible, proximity)
+                first_infects = infected[pairs[:, 0]]
+                targets = np.where(first_infects, pairs[:, 1], pairs[:, 0])
+                sources = np.where(first_infects, pairs[:, 0], pairs[:, 1])
+                counts = (int(np.count_nonzero(infected[owned])), int(np.count_nonzero(immunity[owned])))
+                connection.send((targets, sources, counts))
+    finally:
+        for block in blocks:
+            block.close()
+
+
+def _route(replies, num_tiles):
+    """Sorts every worker's outgoing (agents, destination tiles) by destination."""
+    agents = np.concatenate([reply[0] for reply in replies])
+    destinations = np.concatenate([reply[1] for reply in replies])
+    order = np.argsort(destinations, kind="stable")
+    bounds = np.searchsorted(destinations[order], np.arange(num_tiles + 1))
+    return [agents[order[bounds[tile]:bounds[tile + 1]]] for tile in range(num_tiles)]
+
+
+def _newlyInfected(population, targets, sources, mode, rng):
+    """
+    Rolls infection exactly as infection.batchInfect would over the full sorted
+    contact list: its exposures list every (target, infector) contact with
+    target < infector in (target, infector) order, then the rest in
+    (infector, target) order.
+    """
+    if mode == "contact":
+        first = targets < sources
+        order_first = np.lexsort((sources[first], targets[first]))
+        order_second = np.lexsort((targets[~first], sources[~first]))
+        exposed = np.concatenate((targets[first][order_first], targets[~first][order_second]))
+        rolls = rng.uniform(size=len(exposed))
+        return np.unique(exposed[rolls > population.resistance[exposed]])
+    if mode == "agent":
+        exposed, counts = np.unique(targets, return_counts=True)
+        escape = population.resistance[exposed] ** counts
+        rolls = rng.uniform(size=len(exposed))
+        return exposed[rolls > escape]
+    raise ValueError(f"The tiled engine needs a batch infection mode, not {mode!r}")
+
+
+def simulateTiled(num_agents=500, num_initial_infected=10, resistance=0.3,
+                  step_size=5, bounds=(0, 500), timesteps=500,
+                  proximity=10, vaccination_rate=0.2, vaccination_step=100,
+                  infection_mode="contact", workers=None, rng=None, recorder=None, onStep=None):
+    """
+    simulateRun split across worker processes, one per spatial tile of the plane.
+
+    Agent arrays live in shared memory. Workers move their own agents, advance
+    their counters and search contacts for their own susceptible agents, using
+    halo agents from neighboring tiles within proximity of the border; agents
+    crossing a border migrate to the tile they moved into. Only agent ids travel
+    between processes.
+
+    This process keeps the random stream: it draws the moves, vaccinations and
+    infection rolls in the same order as simulateRun, so given the same seeded
+    rng the statistics are identical to simulateRun's for any number of workers.
+
+    Parameters:
+    infection_mode (str): "contact" or "agent"; the sequential mode cannot be split.
+    workers (int): Worker processes, all available cores by default.
+
+    Returns:
+    dict: "statistics" is a (timesteps, 3) int array of (infected, immune, healthy) counts.
+    """
+    if infection_mode not in ("contact", "agent"):
+        raise ValueError(f"The tiled engine needs a batch infection mode, not {infection_mode!r}")
+    workers = workers or os.cpu_count() or 1
+    grid = TileGrid.forWorkers(bounds, workers, proximity)
+    random = randomSource(rng)
+    population = Population.random(num_agents, bounds, resistance, num_initial_infected, rng)
+    vaccinate_agents(population, vaccination_rate, rng)
+
+    blocks = {}
+    shared = {}
+    context = multiprocessing.get_context("spawn")
+    connections, processes = [], []
+    try:
+        for name, (dtype, _) in SHARED_ARRAYS.items():
+            shape = _sharedShape(name, num_agents)
+            size = max(1, int(np.prod(shape)) * np.dtype(dtype).itemsize)
+            blocks[name] = shared_memory.SharedMemory(create=True, size=size)
+            shared[name] = np.ndarray(shape, dtype=dtype, buffer=blocks[name].buf)
+        shared["xy"][:] = population.positions()
+        for name in ("infected", "immunity", "vaccinated", "infectedCounter", "immunityCounter"):
+            shared[name][:] = getattr(population, name)
+            setattr(population, name, shared[name])
+        # Population methods (vaccination, positions for frames) now work on the shared arrays.
+        population.x = shared["xy"][:, 0]
+        population.y = shared["xy"][:, 1]
+
+        block_names = {name: block.name for name, block in blocks.items()}
+        for tile in range(len(grid)):
+            parent, child = context.Pipe()
+            process = context.Process(target=_tileWorker, daemon=True,
+                                      args=(child, tile, grid, num_agents, block_names, proximity))
+            process.start()
+            connections.append(parent)
+            processes.append(process)
+        homes = grid.tileOf(shared["xy"])
+        for tile, connection in enumerate(connections):
+            connection.send(("own", np.flatnonzero(homes == tile)))
+        for connection in connections:
+            connection.recv()
+
+        statistics = np.empty((timesteps, 3), dtype=np.int64)
+        for i in range(timesteps):
+            if i == vaccination_step:
+                vaccinate_agents(population, vaccination_rate, rng)
+            shared["moves"][:] = random.uniform(-1, 1, (num_agents, 2))
+            for connection in connections:
+                connection.send(("move", (step_size, bounds)))
+            replies = [connection.recv() for connection in connections]
+            arrivals = _route([(reply[0], reply[1]) for reply in replies], len(grid))
+            halos = _route([(reply[2], reply[3]) for reply in replies], len(grid))
+            for tile, connection in enumerate(connections):
+                connection.send(("infect", (arrivals[tile], halos[tile])))
+            replies = [connection.recv() for connection in connections]
+
+            targets = np.concatenate([reply[0] for reply in replies])
+            sources = np.concatenate([reply[1] for reply in replies])
+            newly_infected = _newlyInfected(population, targets, sources, infection_mode, random)
+            population.infected[newly_infected] = True
+            population.infectedCounter[newly_infected] = INFECTED_DURATION
+            population.resistance[newly_infected] *= RESISTANCE_GROWTH
+
+            num_infected = sum(reply[2][0] for reply in replies) + len(newly_infected)
+            num_immune = sum(reply[2][1] for reply in replies)
+            statistics[i] = (num_infected, num_immune, num_agents - num_infected - num_immune)
+            if recorder is not None:
+                recordFrame(recorder, i, population)
+            if onStep is not None:
+                onStep(i, statistics[:i + 1])
+        return {"statistics": statistics}
+    finally:
+        for connection in connections:
+            try:
+                connection.send(("stop", None))
+            except (BrokenPipeError, OSError):
+                pass
+        for process in processes:
+            process.join(timeout=5)
+            if process.is_alive():
+                process.terminate()
+        # Drop every view onto the blocks before closing them.
+        population = shared = None
+        for block in blocks.values():
+            block.close()
+            block.unlink()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Run the simulation split across worker processes by spatial tile.")
+    parser.add_argument("--num-agents", type=int, default=1000000)
+    parser.add_argument("--initial-infected", type=int, default=100)
+    parser.add_argument("--resistance", type=float, default=0.3)
+    parser.add_argument("--step-size", type=float, default=5)
+    parser.add_argument("--timesteps", type=int, default=100)
+    parser.add_argument("--proximity", type=float, default=10)
+    parser.add_argument("--bounds", type=float, default=None,
+                        help="Side of the plane; by default it grows with the population to keep the density of 500 agents on 500x500")
+    parser.add_argument("--vaccination-rate", type=float, default=0.2)
+    parser.add_argument("--vaccination-step", type=int, default=100)
+    parser.add_argument("--infection-mode", choices=("contact", "agent"), default="contact")
+    parser.add_argument("--workers", type=int, default=None)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", default="tiled_stats.npy")
+    args = parser.parse_args(argv)
+
+    side = args.bounds or 500 * np.sqrt(args.num_agents / 500)
+    start = time.perf_counter()
+    result = simulateTiled(
+        num_agents=args.num_agents, num_initial_infected=args.initial_infected,
+        resistance=args.resistance, step_size=args.step_size, bounds=(0, side),
+        timesteps=args.timesteps, proximity=args.proximity,
+        vaccination_rate=args.vaccination_rate, vaccination_step=args.vaccination_step,
+        infection_mode=args.infection_mode, workers=args.workers, rng=np.random.default_rng(args.seed),
+    )
+    elapsed = time.perf_counter() - start
+    np.save(args.output, result["statistics"])
+    print(f"{args.timesteps} steps in {elapsed:.1f} s, final (infected, immune, healthy) = "
+          f"{tuple(int(count) for count in result['statistics'][-1])}; statistics saved as {args.output}")
+
+
+if __name__ == "__main__":
+    main()